@@ -122,9 +122,7 @@ export default function ChatsPage() {
       typeof window !== 'undefined'
         ? window.localStorage.getItem('auth_token')
         : null
-    const url = `${location.protocol}//${location.hostname}:5000/tenants/${tenantId}/events${
-      token ? `?token=${encodeURIComponent(token)}` : ''
-    }`
+    const url = api.eventsUrl(tenantId, token)
 
     let es: EventSource | null = null
     try {
@@ -659,16 +659,30 @@ export default function DashboardPage() {
                     setKnowledgeUploading(true)
                     try {
                       const res = await api.uploadKnowledgeFile(tenantId, file, { append: true })
-                      if (res && res.status === 'ok') {
-                        setKnowledgeUploadNote(`Imported ${file.name}`)
-                        const refreshed = await api.getKnowledge(tenantId)
-                        setKnowledgeText(
-                          refreshed && typeof refreshed.raw_text === 'string'
-                            ? refreshed.raw_text
-                            : '',
+                      let job = res
+                      // Stop polling after 10 minutes; the job keeps running server-side.
+                      const deadline = Date.now() + 10 * 60 * 1000
+                      const pending = (j: any) =>
+                        j && j.job_id && (j.status === 'queued' || j.status === 'extracting' || j.status === 'indexing')
+                      while (pending(job) && Date.now() < deadline) {
+                        if (job.pages_total) {
+                          setKnowledgeUploadNote(`Processing ${file.name} (${job.pages_done}/${job.pages_total} pages)`)
+                        }
+                        await new Promise((resolve) => setTimeout(resolve, 1000))
+                        job = await api.getKnowledgeJob(tenantId, job.job_id)
+                      }
+                      if (pending(job)) {
+                        setKnowledgeUploadNote(`${file.name} is still processing; check back shortly`)
+                      } else if (job && (job.status === 'ok' || job.status === 'done')) {
+                        // Uploaded files are stored as separate documents; the
+                        // textarea below only holds the manual notes.
+                        setKnowledgeUploadNote(
+                          job.dedupe?.duplicate_of
+                            ? `${file.name} is already imported`
+                            : `Imported ${file.name}`,
                         )
                       } else {
-                        setKnowledgeUploadNote(res?.error ? String(res.error) : 'Upload failed')
+                        setKnowledgeUploadNote(job?.error ? String(job.error) : 'Upload failed')
                       }
                     } catch (err) {
                       console.error('Knowledge upload failed', err)
@@ -60,9 +60,7 @@ export default function OrdersPage() {
       typeof window !== 'undefined'
         ? window.localStorage.getItem('auth_token')
         : null
-    const url = `${location.protocol}//${location.hostname}:5000/tenants/${tenantId}/events${
-      token ? `?token=${encodeURIComponent(token)}` : ''
-    }`
+    const url = api.eventsUrl(tenantId, token)
 
     let stopped = false
     const refresh = async () => {
@@ -49,9 +49,7 @@ export default function TracePage() {
   useEffect(() => {
     if (!mounted || !tenantId) return
     const token = typeof window !== 'undefined' ? localStorage.getItem('auth_token') : null
-    const url = `${location.protocol}//${location.hostname}:5000/tenants/${tenantId}/events${
-      token ? `?token=${encodeURIComponent(token)}` : ''
-    }`
+    const url = api.eventsUrl(tenantId, token)
     let es: EventSource | null = null
     try {
       es = new EventSource(url)
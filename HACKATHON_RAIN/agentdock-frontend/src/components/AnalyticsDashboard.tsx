@@ -38,14 +38,10 @@ export default function AnalyticsDashboard({ tenantId }: { tenantId: number }) {
   useEffect(() => {
     const loadData = async () => {
       try {
-        const [analyticsData, sentimentData, suggestionsData] = await Promise.all([
-          api.getAnalytics(tenantId),
-          api.getSentimentAnalysis(tenantId),
-          api.getOptimizationSuggestions(tenantId)
-        ])
-        setAnalytics(analyticsData)
-        setSentiment(sentimentData)
-        setSuggestions(suggestionsData.suggestions || [])
+        const summary = await api.getDashboardSummary(tenantId)
+        setAnalytics(summary.analytics)
+        setSentiment(summary.sentiment)
+        setSuggestions(summary.optimization?.suggestions || [])
       } catch (error) {
         console.error('Failed to load analytics:', error)
       } finally {
@@ -232,6 +232,18 @@ export const api = {
     })
   },
 
+  eventsUrl(tenantId: number, token?: string | null) {
+    // SSE can be served by the separate async events gateway.
+    const base = process.env.NEXT_PUBLIC_EVENTS_BASE_URL || getApiBaseUrl()
+    return `${base}/tenants/${tenantId}/events${token ? `?token=${encodeURIComponent(token)}` : ''}`
+  },
+
+  async getKnowledgeJob(tenantId: number, jobId: number) {
+    return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/knowledge/jobs/${jobId}`, {
+      headers: { ...getAuthHeaders() },
+    })
+  },
+
   async listConversations(tenantId: number) {
     return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/conversations`, {
       headers: { ...getAuthHeaders() },
@@ -268,8 +280,13 @@ export const api = {
     })
   },
 
-  async getAppointments(tenantId: number) {
-    return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/appointments`, {
+  async getAppointments(tenantId: number, params: { from?: string; to?: string; limit?: number; cursor?: string } = {}) {
+    const query = new URLSearchParams()
+    Object.entries(params).forEach(([key, value]) => {
+      if (value !== undefined && value !== '') query.set(key, String(value))
+    })
+    const suffix = query.toString() ? `?${query.toString()}` : ''
+    return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/appointments${suffix}`, {
       headers: { ...getAuthHeaders() },
     })
   },
@@ -289,6 +306,24 @@ export const api = {
     return fetchJson(url, { headers: { ...getAuthHeaders() } })
   },
 
+  async searchMessages(tenantId: number, params: {
+    q: string
+    customer_id?: number
+    direction?: 'in' | 'out'
+    from?: string
+    to?: string
+    limit?: number
+    cursor?: string
+  }) {
+    const query = new URLSearchParams()
+    Object.entries(params).forEach(([key, value]) => {
+      if (value !== undefined && value !== '') query.set(key, String(value))
+    })
+    return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/messages/search?${query.toString()}`, {
+      headers: { ...getAuthHeaders() },
+    })
+  },
+
   async getConversationSummary(tenantId: number, customerId: number) {
     return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/conversations/${customerId}/summary`, {
       headers: { ...getAuthHeaders() },
@@ -310,11 +345,26 @@ export const api = {
   },
 
   async resetTenant(tenantId: number, opts?: { wipe_profile?: boolean }) {
-    return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/reset`, {
+    // The reset runs as a background job; resolve once the data is actually gone.
+    const job = await fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/reset`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json', ...getAuthHeaders() },
       body: JSON.stringify(opts || {}),
     })
+    return api.waitForPurgeJob(tenantId, job.job_id)
+  },
+
+  async waitForPurgeJob(tenantId: number, jobId: number, intervalMs = 1000, timeoutMs = 10 * 60_000) {
+    const deadline = Date.now() + timeoutMs
+    for (;;) {
+      const job = await fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/purge-jobs/${jobId}`, {
+        headers: { ...getAuthHeaders() },
+      })
+      if (job.status === 'done') return job
+      if (job.status === 'failed') throw new Error(job.error || 'Reset failed')
+      if (Date.now() > deadline) throw new Error('Reset is still running; check back later')
+      await new Promise((resolve) => setTimeout(resolve, intervalMs))
+    }
   },
 
   async updateAppointmentStatus(appointmentId: number, status: string) {
@@ -479,6 +529,12 @@ export const api = {
     })
   },
 
+  async getDashboardSummary(tenantId: number) {
+    return fetchJson(`${getApiBaseUrl()}/tenants/${tenantId}/dashboard-summary`, {
+      headers: { ...getAuthHeaders() },
+    })
+  },
+
   async generateSocialContent(tenantId: number, params: {
     platform: string
     content_type: string
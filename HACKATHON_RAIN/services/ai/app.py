@@ -300,7 +300,8 @@ def build_system_prompt(tenant_id: int | None = None, business_profile: dict | N
     "Supported actions:\n"
     "- CREATE_APPOINTMENT: {\"type\":\"CREATE_APPOINTMENT\",\"start_time_iso\":\"...\",\"service_name\":\"...\",\"customer_name\":\"...\",\"customer_phone\":\"...\"}\n"
     "- QUOTE_PRICE (tool): {\"type\":\"QUOTE_PRICE\",\"service_name\":\"...\"}\n"
-    "- CHECK_AVAILABILITY (tool): {\"type\":\"CHECK_AVAILABILITY\",\"start_time_iso\":\"...\"}\n"
+    "- CHECK_AVAILABILITY (tool): {\"type\":\"CHECK_AVAILABILITY\",\"start_time_iso\":\"...\",\"service_name\":\"...\"} (returns alternatives when the time is taken)\n"
+    "- FIND_AVAILABLE_SLOTS (tool): {\"type\":\"FIND_AVAILABLE_SLOTS\",\"service_name\":\"...\",\"after_iso\":\"...\",\"count\":3}\n"
     "- CREATE_ORDER: {\"type\":\"CREATE_ORDER\",\"items\":[{\"name\":\"...\",\"qty\":1}],\"customer_name\":\"...\",\"customer_phone\":\"...\"}\n"
     "- ESCALATE_TO_HUMAN: {\"type\":\"ESCALATE_TO_HUMAN\",\"reason\":\"...\"}\n"
     "- CREATE_COMPLAINT: {\"type\":\"CREATE_COMPLAINT\",\"complaint_details\":\"...\",\"category\":\"...\",\"priority\":\"...\",\"customer_name\":\"...\",\"customer_phone\":\"...\"}\n"
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Archival job for message and agent-trace history.
+
+Creates upcoming monthly partitions (PostgreSQL), then moves every month
+older than ARCHIVE_AFTER_MONTHS out of the database into gzipped
+per-tenant JSON-lines files under ARCHIVE_DIR. Archived messages stay
+readable through GET /tenants/<id>/messages?archived=1.
+
+Usage:
+  python archive_history.py                        # uses DATABASE_URL / ARCHIVE_AFTER_MONTHS
+  python archive_history.py --older-than-months 6
+  python archive_history.py --partitions-only      # just premake partitions
+
+Run it daily (cron, a scheduled container, ...). Months are committed one
+at a time, so an interrupted run is picked up by the next one.
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+import app as api
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Archive old messages and agent traces.")
+  parser.add_argument(
+    "--older-than-months",
+    type=int,
+    default=None,
+    help=f"Archive months that ended more than this many months ago (default {api.ARCHIVE_AFTER_MONTHS}).",
+  )
+  parser.add_argument("--partitions-only", action="store_true", help="Only create upcoming monthly partitions.")
+  args = parser.parse_args(argv)
+
+  created = api.ensure_month_partitions()
+  archived = []
+  if not args.partitions_only:
+    db = api.SessionLocal()
+    try:
+      archived = api.archive_old_months(db, older_than_months=args.older_than_months)
+    finally:
+      db.close()
+  print(json.dumps({"partitions_created": created, "archived": archived}, indent=2))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
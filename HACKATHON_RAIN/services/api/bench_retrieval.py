@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality + latency benchmark for the knowledge (RAG) path.
+
+Builds a labelled query -> expected-chunk dataset from the
+business_profiles/*_example.json templates, pads the knowledge base with
+synthetic FAQ documents, and reports recall@k, MRR and p50/p95 latency of
+retrieve_knowledge_chunks() at several knowledge-base sizes. Timings bypass
+the per-tenant retrieval cache so they measure the search itself.
+
+Usage:
+  python bench_retrieval.py                                  # temp SQLite, default sizes
+  python bench_retrieval.py --sizes 10,1000,100000 -k 4
+  python bench_retrieval.py --database-url sqlite:///bench.db \\
+                            --database-url postgresql://localhost/agentdock_bench
+  python bench_retrieval.py --json bench_results.json
+
+Point --database-url at a scratch database: a throwaway tenant is created
+per run and removed afterwards (pass --keep to leave it in place).
+"""
+
+import argparse
+import glob
+import importlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.path.join(os.path.dirname(os.path.dirname(API_DIR)), "business_profiles")
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+_FILLER_TOPICS = [
+  "parking", "wifi", "gift cards", "loyalty points", "group bookings", "pets", "children",
+  "wheelchair access", "late arrivals", "home service", "delivery", "catering", "student discount",
+  "public holidays", "rainy season", "generator power", "staff training", "hygiene", "uniforms",
+  "bulk orders", "corporate accounts", "referrals", "reviews", "photography", "music",
+]
+_FILLER_WORDS = (
+  "we our your team customers service booking order price time day week month please kindly "
+  "available request contact message whatsapp call visit store branch manager staff policy "
+  "payment transfer cash card receipt confirm cancel change update note special offer seasonal "
+  "weekend morning evening afternoon early late quick simple easy friendly safe clean fresh"
+).split()
+
+
+def load_profiles(profiles_dir: str = PROFILES_DIR) -> List[Dict[str, Any]]:
+  profiles = []
+  for path in sorted(glob.glob(os.path.join(profiles_dir, "*_example.json"))):
+    with open(path, "r", encoding="utf-8") as f:
+      profiles.append(json.load(f))
+  return profiles
+
+
+def build_labelled_documents(profiles: List[Dict[str, Any]]) -> tuple:
+  """
+  Turn each business profile into an FAQ-style knowledge document and a
+  list of labelled queries. Each query carries a "needle": a sentence that
+  only appears in the chunk(s) that correctly answer it.
+  Returns (documents, queries) where queries are {"query", "needle", "business"}.
+  """
+  documents: List[str] = []
+  queries: List[Dict[str, str]] = []
+
+  for profile in profiles:
+    biz = str(profile.get("name") or "The business").strip()
+    lines: List[str] = [f"{biz} knowledge base"]
+
+    def add(question: str, answer: str, user_queries: List[str]) -> None:
+      lines.append(f"Q: {question}\nA: {answer}")
+      for q in user_queries:
+        queries.append({"query": q, "needle": answer[:120], "business": biz})
+
+    currency = ((profile.get("payments") or {}).get("currency") or "NGN").strip()
+    for s in profile.get("services") or []:
+      name = str(s.get("name") or "").strip()
+      if not name:
+        continue
+      answer = f"At {biz}, {name} costs {currency} {s.get('price')} and takes about {s.get('duration_minutes')} minutes."
+      add(
+        f"How much is {name}?",
+        answer,
+        [f"How much is {name} at {biz}?", f"{name} price"],
+      )
+
+    for day, hours in (profile.get("opening_hours") or {}).items():
+      answer = f"On {day.title()}, {biz} is open {hours}."
+      add(f"What are your hours on {day.title()}?", answer, [f"When is {biz} open on {day}?"])
+
+    location = profile.get("location")
+    if location:
+      add("Where are you located?", f"{biz} is located at {location}.", [f"Where is {biz} located?"])
+
+    methods = (profile.get("payments") or {}).get("methods") or []
+    if methods:
+      add(
+        "How can I pay?",
+        f"{biz} accepts these payment methods: {', '.join(methods)}.",
+        [f"What payment methods does {biz} accept?"],
+      )
+
+    refunds = profile.get("refunds") or {}
+    if refunds.get("refund_policy"):
+      add("What is your refund policy?", str(refunds["refund_policy"]), [f"refund policy for {biz}", "Can I cancel my booking and get a refund?"])
+
+    rules = profile.get("booking_rules") or {}
+    if rules.get("late_policy"):
+      add("What happens if I am late?", str(rules["late_policy"]), ["What happens if I arrive late?"])
+
+    documents.append("\n\n".join(lines))
+
+  return documents, queries
+
+
+def synthetic_faq_document(rng: random.Random, n_entries: int) -> str:
+  """Distractor FAQ text that shares vocabulary with real answers."""
+  entries = []
+  for _ in range(n_entries):
+    topic = rng.choice(_FILLER_TOPICS)
+    body = " ".join(rng.choices(_FILLER_WORDS, k=rng.randint(25, 45)))
+    entries.append(f"Q: Do you have a policy on {topic}?\nA: About {topic}: {body}.")
+  return "\n\n".join(entries)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+  if not values:
+    return 0.0
+  ordered = sorted(values)
+  idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+  return ordered[idx]
+
+
+class RetrievalBenchmark:
+  """
+  Grows one scratch tenant's knowledge base through the requested sizes and
+  evaluates the labelled queries at each size against the given app module.
+  """
+
+  def __init__(self, api: Any, k: int = 4, repeat: int = 3, seed: int = 7, backend: Optional[str] = None):
+    self.api = api
+    self.k = k
+    self.repeat = max(1, repeat)
+    self.rng = random.Random(seed)
+    self.backend = backend or api.engine.dialect.name
+    self.tenant_id: Optional[int] = None
+    self.chunk_count = 0
+    self.labelled_chunks: List[Dict[str, Any]] = []  # {"id", "content"}
+    self._pending_labelled: List[str] = []
+
+  def setup(self, profiles: List[Dict[str, Any]]) -> None:
+    api = self.api
+    documents, self.queries = build_labelled_documents(profiles)
+    for doc in documents:
+      self._pending_labelled.extend(api.chunk_text(doc))
+
+    db = api.SessionLocal()
+    try:
+      tenant = api.Tenant(name="Retrieval benchmark", business_type="general")
+      db.add(tenant)
+      db.commit()
+      self.tenant_id = int(tenant.id)
+    finally:
+      db.close()
+
+  def teardown(self) -> None:
+    if self.tenant_id is None:
+      return
+    api = self.api
+    db = api.SessionLocal()
+    try:
+      db.query(api.KnowledgeChunk).filter(api.KnowledgeChunk.tenant_id == self.tenant_id).delete()
+      db.query(api.Tenant).filter(api.Tenant.id == self.tenant_id).delete()
+      db.commit()
+    finally:
+      db.close()
+
+  def _insert_chunks(self, contents: List[str], source: str) -> List[int]:
+    api = self.api
+    db = api.SessionLocal()
+    ids: List[int] = []
+    try:
+      for start in range(0, len(contents), 2000):
+        batch = []
+        for content in contents[start : start + 2000]:
+          kc = api.KnowledgeChunk(
+            tenant_id=self.tenant_id,
+            source=source,
+            chunk_index=self.chunk_count,
+            content=content,
+          )
+          self.chunk_count += 1
+          batch.append(kc)
+        db.add_all(batch)
+        db.flush()
+        ids.extend(int(kc.id) for kc in batch)
+        db.commit()
+    finally:
+      db.close()
+    return ids
+
+  def grow_to(self, size: int) -> None:
+    need = size - self.chunk_count
+    if need <= 0:
+      return
+    if self._pending_labelled:
+      take = self._pending_labelled[:need]
+      self._pending_labelled = self._pending_labelled[need:]
+      ids = self._insert_chunks(take, "bench_labelled")
+      self.labelled_chunks.extend({"id": i, "content": c} for i, c in zip(ids, take))
+      need -= len(take)
+
+    filler: List[str] = []
+    while len(filler) < need:
+      doc = synthetic_faq_document(self.rng, n_entries=12)
+      filler.extend(self.api.chunk_text(doc))
+    if need > 0:
+      self._insert_chunks(filler[:need], "bench_filler")
+
+  def _expected_ids(self, needle: str) -> set:
+    return {c["id"] for c in self.labelled_chunks if needle in c["content"]}
+
+  def evaluate(self) -> Dict[str, Any]:
+    api = self.api
+    hits_at_1 = 0
+    hits_at_k = 0
+    rr_total = 0.0
+    latencies_ms: List[float] = []
+    evaluated = 0
+
+    db = api.SessionLocal()
+    try:
+      for item in self.queries:
+        expected = self._expected_ids(item["needle"])
+        if not expected:
+          # Answer chunk not part of the knowledge base at this size.
+          continue
+        evaluated += 1
+        results: List[dict] = []
+        for _ in range(self.repeat):
+          t0 = time.perf_counter()
+          results = api.retrieve_knowledge_chunks(
+            db, self.tenant_id, item["query"], limit=self.k, use_cache=False
+          )
+          latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+
+        ranked = [int(r["chunk_id"]) for r in results]
+        for rank, chunk_id in enumerate(ranked, start=1):
+          if chunk_id in expected:
+            rr_total += 1.0 / rank
+            hits_at_k += 1
+            if rank == 1:
+              hits_at_1 += 1
+            break
+    finally:
+      db.close()
+
+    denom = float(evaluated or 1)
+    return {
+      "backend": self.backend,
+      "chunks": self.chunk_count,
+      "queries": evaluated,
+      "k": self.k,
+      "recall_at_1": round(hits_at_1 / denom, 4),
+      "recall_at_k": round(hits_at_k / denom, 4),
+      "mrr": round(rr_total / denom, 4),
+      "p50_ms": round(_percentile(latencies_ms, 50), 3),
+      "p95_ms": round(_percentile(latencies_ms, 95), 3),
+    }
+
+
+def run_benchmark(
+  api: Any,
+  sizes: List[int],
+  k: int = 4,
+  repeat: int = 3,
+  keep: bool = False,
+  profiles: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+  """
+  Run the benchmark against an already-imported app module.
+  Returns one result row per knowledge-base size.
+  """
+  bench = RetrievalBenchmark(api, k=k, repeat=repeat)
+  bench.setup(profiles if profiles is not None else load_profiles())
+  rows = []
+  try:
+    for size in sorted(sizes):
+      bench.grow_to(size)
+      rows.append(bench.evaluate())
+  finally:
+    if not keep:
+      bench.teardown()
+  return rows
+
+
+def import_api_for(database_url: str) -> Any:
+  """Import (or re-import) the API module bound to database_url, migrated."""
+  os.environ["DATABASE_URL"] = database_url
+  if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+  if "app" in sys.modules:
+    del sys.modules["app"]
+  api = importlib.import_module("app")
+  api.migrate_db()
+  return api
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+  header = f"{'backend':<11}{'chunks':>9}{'queries':>9}{'recall@1':>10}{'recall@k':>10}{'mrr':>8}{'p50 ms':>10}{'p95 ms':>10}"
+  print(header)
+  print("-" * len(header))
+  for r in rows:
+    print(
+      f"{r['backend']:<11}{r['chunks']:>9}{r['queries']:>9}{r['recall_at_1']:>10.3f}"
+      f"{r['recall_at_k']:>10.3f}{r['mrr']:>8.3f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Benchmark knowledge retrieval quality and latency.")
+  parser.add_argument("--database-url", action="append", default=[], help="Database to benchmark (repeatable).")
+  parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="Comma-separated chunk counts.")
+  parser.add_argument("-k", type=int, default=4, help="Top-k passed to retrieve_knowledge_chunks.")
+  parser.add_argument("--repeat", type=int, default=3, help="Timed runs per query.")
+  parser.add_argument("--keep", action="store_true", help="Keep the benchmark tenant and chunks afterwards.")
+  parser.add_argument("--json", dest="json_path", help="Also write results as JSON to this path.")
+  args = parser.parse_args(argv)
+
+  sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+  urls = list(args.database_url)
+  tmpdir = None
+  if not urls:
+    tmpdir = tempfile.TemporaryDirectory()
+    urls = ["sqlite:///" + os.path.join(tmpdir.name, "bench.db").replace("\\", "/")]
+    if os.getenv("BENCH_POSTGRES_URL"):
+      urls.append(os.environ["BENCH_POSTGRES_URL"])
+
+  all_rows: List[Dict[str, Any]] = []
+  try:
+    for url in urls:
+      api = import_api_for(url)
+      rows = run_benchmark(api, sizes, k=args.k, repeat=args.repeat, keep=args.keep)
+      all_rows.extend(rows)
+      api.engine.dispose()
+  finally:
+    if tmpdir is not None:
+      tmpdir.cleanup()
+
+  print_table(all_rows)
+  if args.json_path:
+    with open(args.json_path, "w", encoding="utf-8") as f:
+      json.dump(all_rows, f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Write-throughput benchmark for the delta-sync version stamp.
+
+Every commit that touches a synced model bumps tenants.sync_version in the
+before_commit hook (_sync_stamp_versions), which row-locks the tenant from
+that point until COMMIT. This measures what that costs: worker threads
+commit one message per transaction, either all for one tenant (they queue
+on the tenant row) or one tenant per thread (no shared lock), optionally
+holding each transaction open for --hold-ms of simulated work before
+committing. Because the lock is taken at commit time, the hold should not
+serialize same-tenant writers; only the stamp-and-commit tail does.
+
+Usage:
+  python bench_sync_commits.py                          # temp SQLite
+  python bench_sync_commits.py --database-url postgresql://localhost/agentdock_bench \\
+                               --threads 16 --commits 200 --hold-ms 5
+
+SQLite serializes every writer on the database lock, so only a PostgreSQL
+run says anything about the tenant row lock. A throwaway tenant per thread
+is created and removed afterwards.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_api_for(database_url: str) -> Any:
+  """Import (or re-import) the API module bound to database_url, migrated."""
+  os.environ["DATABASE_URL"] = database_url
+  if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+  if "app" in sys.modules:
+    del sys.modules["app"]
+  api = importlib.import_module("app")
+  api.migrate_db()
+  return api
+
+
+def _percentile(values: List[float], pct: float) -> float:
+  if not values:
+    return 0.0
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run_scenario(api: Any, tenant_ids: List[int], threads: int, commits: int, hold_ms: float) -> Dict[str, Any]:
+  """
+  `threads` writers, writer i using tenant_ids[i % len(tenant_ids)].
+  Returns commits/s and commit latency (the before_commit stamp + COMMIT).
+  """
+  latencies: List[float] = []
+  lock = threading.Lock()
+  barrier = threading.Barrier(threads + 1)
+
+  def writer(index: int) -> None:
+    tenant_id = tenant_ids[index % len(tenant_ids)]
+    own: List[float] = []
+    barrier.wait()
+    for n in range(commits):
+      db = api.SessionLocal()
+      try:
+        db.add(api.Message(tenant_id=tenant_id, direction="in", text=f"bench {index}-{n}"))
+        db.flush()
+        if hold_ms:
+          time.sleep(hold_ms / 1000.0)
+        started = time.perf_counter()
+        db.commit()
+        own.append((time.perf_counter() - started) * 1000.0)
+      finally:
+        db.close()
+    with lock:
+      latencies.extend(own)
+
+  workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+  for w in workers:
+    w.start()
+  barrier.wait()
+  started = time.perf_counter()
+  for w in workers:
+    w.join()
+  elapsed = time.perf_counter() - started
+  return {
+    "commits": len(latencies),
+    "commits_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    "commit_p50_ms": round(_percentile(latencies, 50), 2),
+    "commit_p95_ms": round(_percentile(latencies, 95), 2),
+  }
+
+
+def run_benchmark(api: Any, threads: int, commits: int, hold_ms: float) -> List[Dict[str, Any]]:
+  db = api.SessionLocal()
+  try:
+    tenants = [api.Tenant(name=f"Sync bench {i}", business_type="general") for i in range(threads)]
+    db.add_all(tenants)
+    db.commit()
+    tenant_ids = [t.id for t in tenants]
+  finally:
+    db.close()
+
+  backend = api.engine.dialect.name
+  rows = []
+  try:
+    for label, ids in (("one_tenant", tenant_ids[:1]), ("tenant_per_thread", tenant_ids)):
+      result = run_scenario(api, ids, threads, commits, hold_ms)
+      rows.append(dict(result, backend=backend, scenario=label, threads=threads, hold_ms=hold_ms))
+  finally:
+    db = api.SessionLocal()
+    try:
+      for model in (api.Message, api.TenantDailyRollup, api.TenantDailyConversation, api.Conversation):
+        db.query(model).filter(model.tenant_id.in_(tenant_ids)).delete(synchronize_session=False)
+      db.query(api.Tenant).filter(api.Tenant.id.in_(tenant_ids)).delete(synchronize_session=False)
+      db.commit()
+    finally:
+      db.close()
+  return rows
+
+
+def print_table(rows: List[Dict[str, Any]]) -> None:
+  header = f"{'backend':<11}{'scenario':<19}{'threads':>8}{'hold ms':>9}{'commits/s':>11}{'p50 ms':>9}{'p95 ms':>9}"
+  print(header)
+  print("-" * len(header))
+  for r in rows:
+    print(
+      f"{r['backend']:<11}{r['scenario']:<19}{r['threads']:>8}{r['hold_ms']:>9g}"
+      f"{r['commits_per_s']:>11.1f}{r['commit_p50_ms']:>9.2f}{r['commit_p95_ms']:>9.2f}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Benchmark same-tenant write throughput under the sync version stamp.")
+  parser.add_argument("--database-url", help="Database to benchmark (default: a temporary SQLite file).")
+  parser.add_argument("--threads", type=int, default=8, help="Concurrent writers.")
+  parser.add_argument("--commits", type=int, default=50, help="Commits per writer.")
+  parser.add_argument("--hold-ms", type=float, default=0.0, help="Simulated work inside each transaction.")
+  parser.add_argument("--json", dest="json_path", help="Also write results as JSON to this path.")
+  args = parser.parse_args(argv)
+
+  tmpdir = None
+  url = args.database_url
+  if not url:
+    tmpdir = tempfile.TemporaryDirectory()
+    url = "sqlite:///" + os.path.join(tmpdir.name, "bench.db").replace("\\", "/")
+  try:
+    api = import_api_for(url)
+    rows = run_benchmark(api, max(1, args.threads), max(1, args.commits), max(0.0, args.hold_ms))
+    api.engine.dispose()
+  finally:
+    if tmpdir is not None:
+      tmpdir.cleanup()
+
+  print_table(rows)
+  if args.json_path:
+    with open(args.json_path, "w", encoding="utf-8") as f:
+      json.dump(rows, f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
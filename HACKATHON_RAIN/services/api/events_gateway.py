@@ -0,0 +1,273 @@
+"""
+Async SSE gateway for tenant events.
+
+Serves the same contract as the Flask /tenants/<id>/events route
+(`id:` / `event: tenant_event` / `data:` frames, Last-Event-ID or ?last_id=
+resume, ?token= auth, 15s keepalives) from a single asyncio event loop, so
+open dashboards no longer pin a synchronous API worker each.
+
+Usage:
+  EVENT_BUS_BACKEND=redis uvicorn events_gateway:app --host 0.0.0.0 --port 5003
+
+Point the frontend's NEXT_PUBLIC_EVENTS_BASE_URL at the gateway (or route
+/tenants/*/events to it in the reverse proxy). Run the API and the gateway
+with EVENT_BUS_BACKEND=postgres or redis so events published by the API
+workers reach this process.
+
+Every client gets a bounded buffer. The bus thread never blocks on a slow
+client: when a client's buffer is full it is marked as lagging and its
+buffer dropped, and the client then catches up from the bus's ring buffer
+(and durable backfill) once its socket drains.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from urllib.parse import parse_qs
+
+import app as api
+
+EVENTS_CLIENT_BUFFER = int(os.getenv("EVENTS_CLIENT_BUFFER", "64"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+
+_EVENTS_PATH_RE = re.compile(r"^/tenants/(\d+)/events/?$")
+
+logger = logging.getLogger("events_gateway")
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+
+class _Client:
+  """
+  One open SSE connection. offer() runs on the event loop and never blocks.
+  """
+
+  def __init__(self, tenant_id: int, last_id: int, buffer_size: int) -> None:
+    self.tenant_id = tenant_id
+    self.last_id = last_id
+    self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, buffer_size))
+    # Start lagging so the first pass replays anything after Last-Event-ID.
+    self.lagging = True
+    self.dropped = 0
+
+  def offer(self, evt: dict) -> None:
+    if self.lagging:
+      # Already in the bus's ring buffer; the pending catch-up will read it.
+      return
+    try:
+      self.queue.put_nowait(evt)
+    except asyncio.QueueFull:
+      # Backpressure: drop the buffer and let the writer catch up from the bus.
+      self.lagging = True
+      self.dropped += self.queue.qsize()
+      while not self.queue.empty():
+        self.queue.get_nowait()
+      self.queue.put_nowait(None)
+
+
+class EventsGateway:
+  """
+  ASGI application. Bus events are handed from the bus's thread to the
+  loop with call_soon_threadsafe and fanned out to that tenant's clients.
+  """
+
+  def __init__(self, bus: Optional[api.EventBus] = None, client_buffer: int = EVENTS_CLIENT_BUFFER) -> None:
+    self.bus = bus or api.EVENT_BUS
+    self.client_buffer = client_buffer
+    self.keepalive_seconds = EVENTS_KEEPALIVE_SECONDS
+    self._clients: Dict[int, Set[_Client]] = {}
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+  # --- bus bridge ---------------------------------------------------------
+
+  def _start(self) -> None:
+    if self._loop is not None:
+      return
+    self._loop = asyncio.get_running_loop()
+    self.bus.add_listener(self._on_bus_event)
+    if isinstance(self.bus, api.InMemoryEventBus):
+      logger.warning("events gateway is using the in-memory bus; API events from other processes will not arrive")
+
+  def _stop(self) -> None:
+    if self._loop is None:
+      return
+    self.bus.remove_listener(self._on_bus_event)
+    self._loop = None
+
+  def _on_bus_event(self, tenant_id: int, evt: dict) -> None:
+    loop = self._loop
+    if loop is None or tenant_id not in self._clients:
+      return
+    try:
+      loop.call_soon_threadsafe(self._dispatch, tenant_id, evt)
+    except RuntimeError:
+      # Loop closed during shutdown.
+      pass
+
+  def _dispatch(self, tenant_id: int, evt: dict) -> None:
+    for client in tuple(self._clients.get(tenant_id, ())):
+      client.offer(evt)
+
+  def connection_count(self) -> int:
+    return sum(len(c) for c in self._clients.values())
+
+  # --- ASGI ---------------------------------------------------------------
+
+  async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] == "lifespan":
+      await self._lifespan(receive, send)
+      return
+    if scope["type"] != "http":
+      return
+    self._start()
+
+    path = scope.get("path") or ""
+    method = scope.get("method") or "GET"
+    if path == "/health":
+      await self._json(send, 200, {"status": "ok", "service": "events_gateway", "connections": self.connection_count()})
+      return
+    match = _EVENTS_PATH_RE.match(path)
+    if match is None:
+      await self._json(send, 404, {"error": "not found"})
+      return
+    if method == "OPTIONS":
+      await send({"type": "http.response.start", "status": 204, "headers": self._cors_headers(scope)})
+      await send({"type": "http.response.body", "body": b""})
+      return
+    if method != "GET":
+      await self._json(send, 405, {"error": "method not allowed"})
+      return
+
+    tenant_id = int(match.group(1))
+    query = parse_qs((scope.get("query_string") or b"").decode("latin-1"))
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+
+    loop = asyncio.get_running_loop()
+    error = await loop.run_in_executor(None, self._check_access, tenant_id, (query.get("token") or [""])[0])
+    if error is not None:
+      status, message = error
+      await self._json(send, status, {"error": message}, scope)
+      return
+
+    last_id = 0
+    try:
+      if headers.get("last-event-id"):
+        last_id = int(headers["last-event-id"])
+      elif query.get("last_id"):
+        last_id = int(query["last_id"][0])
+    except ValueError:
+      last_id = 0
+
+    await self._stream(scope, receive, send, tenant_id, last_id)
+
+  async def _lifespan(self, receive: Receive, send: Send) -> None:
+    while True:
+      message = await receive()
+      if message["type"] == "lifespan.startup":
+        self._start()
+        await send({"type": "lifespan.startup.complete"})
+      elif message["type"] == "lifespan.shutdown":
+        self._stop()
+        await send({"type": "lifespan.shutdown.complete"})
+        return
+
+  def _check_access(self, tenant_id: int, token: str) -> Optional[tuple]:
+    token_err = api.event_stream_auth_error(tenant_id, token)
+    if token_err is not None:
+      return 401, token_err
+    db = api.SessionLocal()
+    try:
+      if db.get(api.Tenant, tenant_id) is None:
+        return 404, "tenant not found"
+    finally:
+      db.close()
+      api.SessionLocal.remove()
+    return None
+
+  def _cors_headers(self, scope: Scope) -> list:
+    allowed = api.origins
+    origin = ""
+    for k, v in scope.get("headers") or []:
+      if k.lower() == b"origin":
+        origin = v.decode("latin-1")
+    if allowed == "*":
+      return [(b"access-control-allow-origin", b"*")]
+    if origin and origin in allowed:
+      return [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+    return []
+
+  async def _json(self, send: Send, status: int, body: dict, scope: Optional[Scope] = None) -> None:
+    headers = [(b"content-type", b"application/json")]
+    if scope is not None:
+      headers += self._cors_headers(scope)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode("utf-8")})
+
+  async def _stream(self, scope: Scope, receive: Receive, send: Send, tenant_id: int, last_id: int) -> None:
+    client = _Client(tenant_id, last_id, self.client_buffer)
+    self._clients.setdefault(tenant_id, set()).add(client)
+    client.queue.put_nowait(None)
+
+    async def wait_for_disconnect() -> None:
+      while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+          return
+
+    disconnect = asyncio.ensure_future(wait_for_disconnect())
+    writer = asyncio.ensure_future(self._write_events(client, scope, send))
+    try:
+      await asyncio.wait({disconnect, writer}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+      for task in (disconnect, writer):
+        task.cancel()
+      clients = self._clients.get(tenant_id)
+      if clients is not None:
+        clients.discard(client)
+        if not clients:
+          self._clients.pop(tenant_id, None)
+
+  async def _write_events(self, client: _Client, scope: Scope, send: Send) -> None:
+    headers = [
+      (b"content-type", b"text/event-stream"),
+      (b"cache-control", b"no-cache"),
+      (b"x-accel-buffering", b"no"),
+    ] + self._cors_headers(scope)
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    loop = asyncio.get_running_loop()
+
+    while True:
+      try:
+        item = await asyncio.wait_for(client.queue.get(), timeout=self.keepalive_seconds)
+      except asyncio.TimeoutError:
+        await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+        continue
+
+      if item is None or client.lagging or int(item["id"]) != client.last_id + 1:
+        # Catch up from the bus: initial replay, after an overflow, or on a gap.
+        client.lagging = False
+        events = await loop.run_in_executor(None, self.bus.events_after, client.tenant_id, client.last_id)
+      else:
+        events = [item]
+
+      frames = []
+      for evt in events:
+        evt_id = int(evt["id"])
+        if evt_id <= client.last_id:
+          continue
+        client.last_id = evt_id
+        frames.append(
+          f"id: {evt_id}\nevent: tenant_event\ndata: {json.dumps(evt, ensure_ascii=False)}\n\n"
+        )
+      if frames:
+        # send() waits for the transport to drain; meanwhile offer() keeps the
+        # buffer bounded and flips the client to lagging if it overflows.
+        await send({"type": "http.response.body", "body": "".join(frames).encode("utf-8"), "more_body": True})
+
+
+app = EventsGateway()
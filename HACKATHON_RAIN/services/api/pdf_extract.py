@@ -0,0 +1,26 @@
+"""
+PDF page-range extraction for the knowledge ingest process pool.
+
+Kept out of app.py so the pool's worker processes, which are spawned rather
+than forked from the threaded server, import only this module and PyPDF2
+instead of the whole API (database engine, executors, event bus).
+"""
+
+from typing import List
+
+
+def extract_pdf_page_range(path: str, start: int, end: int) -> List[str]:
+  """
+  Extract text for pages [start, end) of a PDF on disk.
+  """
+  from PyPDF2 import PdfReader  # type: ignore
+
+  reader = PdfReader(path)
+  parts: List[str] = []
+  for idx in range(start, min(end, len(reader.pages))):
+    try:
+      text = reader.pages[idx].extract_text() or ""
+    except Exception:
+      text = ""
+    parts.append(text.strip())
+  return parts
@@ -0,0 +1,155 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class AppointmentListingTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "salon"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed(self, tenant_id: int) -> dict:
+    """
+    Six bookings an hour apart from 09:00 tomorrow, alternating two services,
+    plus a retried duplicate of the 10:00 slot written straight to the table
+    (the POST route would refuse it). Returns the slot start times and ids.
+    """
+    api = self.api
+    day = (datetime.utcnow() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    db = api.SessionLocal()
+    try:
+      services = [
+        api.Service(tenant_id=tenant_id, code=f"s{tenant_id}-{i}", name=name, duration_minutes=60)
+        for i, name in enumerate(("Braids", "Haircut"))
+      ]
+      db.add_all(services)
+      db.flush()
+      appointments = [
+        api.Appointment(tenant_id=tenant_id, service_id=services[i % 2].id, customer_name=f"c{i}",
+                        start_time=day + timedelta(hours=i))
+        for i in range(6)
+      ]
+      db.add_all(appointments)
+      db.flush()
+      retry = api.Appointment(tenant_id=tenant_id, service_id=services[0].id, customer_name="c1-retry",
+                              start_time=day + timedelta(hours=1))
+      db.add(retry)
+      db.commit()
+      ids = [a.id for a in appointments]
+      ids[1] = retry.id
+      return {"day": day, "ids": ids, "stale": appointments[1].id}
+    finally:
+      db.close()
+
+  def _walk(self, path: str, limit: int) -> list:
+    sep = "&" if "?" in path else "?"
+    resp = self.client.get(f"{path}{sep}limit={limit}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    items = resp.get_json()
+    while resp.headers.get("X-Next-Cursor"):
+      resp = self.client.get(f"{path}{sep}limit={limit}&cursor={resp.headers['X-Next-Cursor']}")
+      self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+      items.extend(resp.get_json())
+    return items
+
+  def test_one_statement_with_service_names_and_no_duplicates(self):
+    api = self.api
+    tenant_id = self._create_tenant("Busy Salon")
+    seeded = self._seed(tenant_id)
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+      if "appointments" in statement:
+        statements.append(statement)
+
+    api.event.listen(api.engine, "before_cursor_execute", count)
+    try:
+      items = self.client.get(f"/tenants/{tenant_id}/appointments?limit=50").get_json()
+    finally:
+      api.event.remove(api.engine, "before_cursor_execute", count)
+    self.assertEqual(len(statements), 1, statements)
+
+    self.assertEqual(sorted(item["id"] for item in items), sorted(seeded["ids"]))
+    self.assertNotIn(seeded["stale"], [item["id"] for item in items])
+    names = {item["customer_name"]: item["service_name"] for item in items}
+    self.assertEqual(names["c1-retry"], "Braids")
+    self.assertEqual(names["c2"], "Braids")
+    self.assertEqual(names["c3"], "Haircut")
+
+    # Duplicates are excluded in SQL, so pages stay full and never repeat a slot.
+    paged = self._walk(f"/tenants/{tenant_id}/appointments", limit=2)
+    self.assertEqual([item["id"] for item in paged], [item["id"] for item in items])
+
+  def test_calendar_window_pages_earliest_first(self):
+    tenant_id = self._create_tenant("Calendar Salon")
+    seeded = self._seed(tenant_id)
+    other = self._create_tenant("Other Calendar Salon")
+    self._seed(other)
+
+    day = seeded["day"]
+    window = f"from={(day + timedelta(hours=1)).isoformat()}&to={(day + timedelta(hours=5)).isoformat()}Z"
+    items = self._walk(f"/tenants/{tenant_id}/appointments?{window}", limit=3)
+    self.assertEqual([item["id"] for item in items], seeded["ids"][1:5])
+    starts = [item["start_time"] for item in items]
+    self.assertEqual(starts, sorted(starts))
+
+    open_ended = self._walk(f"/tenants/{tenant_id}/appointments?from={(day + timedelta(hours=4)).isoformat()}", 10)
+    self.assertEqual([item["id"] for item in open_ended], seeded["ids"][4:])
+
+    resp = self.client.get(f"/tenants/{tenant_id}/appointments?from=tomorrow")
+    self.assertEqual(resp.status_code, 400)
+    resp = self.client.get(f"/tenants/{tenant_id}/appointments?{window}&cursor=nope")
+    self.assertEqual(resp.status_code, 400)
+
+  def test_calendar_query_uses_start_time_index(self):
+    api = self.api
+    if api.engine.dialect.name != "sqlite":
+      self.skipTest("plan check is SQLite-specific; see test_index_migrations for PostgreSQL")
+    db = api.SessionLocal()
+    try:
+      day = datetime(2030, 1, 1)
+      query = db.query(api.Appointment.id).filter(
+        api.Appointment.tenant_id == 1,
+        api.Appointment.start_time >= day,
+        api.Appointment.start_time < day + timedelta(days=7),
+      ).order_by(api.Appointment.start_time, api.Appointment.id)
+      compiled = query.statement.compile(api.engine, compile_kwargs={"literal_binds": True})
+      plan = " ".join(str(row[-1]) for row in db.execute(api.text(f"EXPLAIN QUERY PLAN {compiled}")))
+    finally:
+      db.close()
+    self.assertIn("idx_appointments_tenant_start_id", plan)
+    self.assertNotIn("TEMP B-TREE", plan)
+
+
+if __name__ == "__main__":
+  unittest.main()
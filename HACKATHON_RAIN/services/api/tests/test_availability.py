@@ -0,0 +1,223 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+PROFILE = {
+  "opening_hours": {"monday": "09:00-12:00, 13:00-17:00", "sunday": "closed", "tuesday": "whenever"},
+  "booking_rules": {"buffer_minutes": 10, "max_days_in_advance": 14},
+  "services": [{"name": "Braids", "duration_minutes": 90}, {"name": "Trim", "duration_minutes": 30}],
+}
+
+
+class AvailabilityTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "salon"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    tenant_id = int(resp.get_json()["id"])
+    db = self.api.SessionLocal()
+    try:
+      db.get(self.api.Tenant, tenant_id).business_profile = dict(PROFILE)
+      db.add(self.api.Service(tenant_id=tenant_id, name="Braids"))
+      db.commit()
+    finally:
+      db.close()
+    return tenant_id
+
+  def _service_id(self, tenant_id: int) -> int:
+    db = self.api.SessionLocal()
+    try:
+      return db.query(self.api.Service.id).filter_by(tenant_id=tenant_id, name="Braids").scalar()
+    finally:
+      db.close()
+
+  def _next_monday(self) -> datetime:
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=7 - today.weekday())
+
+  def _book(self, tenant_id: int, start: datetime, service_id=None) -> int:
+    resp = self.client.post(
+      f"/tenants/{tenant_id}/appointments", json={"start_time": start.isoformat(), "service_id": service_id}
+    )
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _check(self, tenant_id: int, at: datetime, service: str = "Trim") -> dict:
+    resp = self.client.get(f"/tenants/{tenant_id}/availability?service={service}&at={at.isoformat()}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    return resp.get_json()
+
+  def test_duration_buffer_and_opening_hours(self):
+    monday = self._next_monday()
+    tenant_id = self._create_tenant("Interval Salon")
+    # Braids has no duration in the table, so the profile's 90 minutes apply.
+    self._book(tenant_id, monday.replace(hour=9), self._service_id(tenant_id))
+
+    body = self._check(tenant_id, monday.replace(hour=10, minute=30))
+    self.assertEqual((body["available"], body["reason"]), (False, "slot already booked"))
+    self.assertEqual(body["duration_minutes"], 30)
+    self.assertTrue(self._check(tenant_id, monday.replace(hour=10, minute=40))["available"])
+    self.assertTrue(self._check(tenant_id, monday.replace(hour=8, minute=50))["available"] is False)
+
+    late = self._check(tenant_id, monday.replace(hour=11), service="Braids")
+    self.assertEqual(late["reason"], "outside opening hours (09:00-12:00, 13:00-17:00)")
+    self.assertEqual(self._check(tenant_id, monday - timedelta(days=1))["reason"], "closed on sunday")
+    self.assertIsNone(self._check(tenant_id, monday + timedelta(days=1, hours=10))["available"])
+    self.assertEqual(self._check(tenant_id, monday + timedelta(days=21, hours=10))["reason"], "more than 14 days ahead")
+
+    self.assertEqual(
+      body["slots"],
+      [monday.replace(hour=10, minute=45).isoformat(), monday.replace(hour=11, minute=15).isoformat(),
+       monday.replace(hour=13).isoformat()],
+    )
+    resp = self.client.get(f"/tenants/{tenant_id}/availability?service=Braids&count=2&at={monday.isoformat()}")
+    self.assertEqual(resp.get_json()["slots"], [monday.replace(hour=13).isoformat(), monday.replace(hour=14, minute=30).isoformat()])
+
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/availability?at=monday").status_code, 400)
+    self.assertEqual(self.client.get("/tenants/999999/availability").status_code, 404)
+
+  def test_bookings_and_profile_edits_are_followed(self):
+    api = self.api
+    engine = api._AVAILABILITY_ENGINE
+    monday = self._next_monday()
+    tenant_id = self._create_tenant("Following Salon")
+    noon = monday.replace(hour=12)
+    self.assertEqual(self._check(tenant_id, noon)["slots"][0], monday.replace(hour=13).isoformat())
+
+    full = engine.full_refreshes
+    appointment_id = self._book(tenant_id, monday.replace(hour=13))
+    self.assertEqual(self._check(tenant_id, noon)["slots"][0], monday.replace(hour=13, minute=45).isoformat())
+    self.client.patch(f"/appointments/{appointment_id}", json={"status": "cancelled"})
+    self.assertEqual(self._check(tenant_id, noon)["slots"][0], monday.replace(hour=13).isoformat())
+    self.assertEqual(engine.full_refreshes, full)
+    self.assertGreaterEqual(engine.incremental_refreshes, 2)
+
+    db = api.SessionLocal()
+    try:
+      tenant = db.get(api.Tenant, tenant_id)
+      tenant.business_profile = {**PROFILE, "opening_hours": {"monday": "14:00-18:00"}}
+      db.commit()
+    finally:
+      db.close()
+    self.assertEqual(self._check(tenant_id, noon)["slots"][0], monday.replace(hour=14).isoformat())
+    self.assertEqual(engine.full_refreshes, full + 1)
+
+  def test_service_duration_edits_drop_the_cached_bookings(self):
+    monday = self._next_monday()
+    tenant_id = self._create_tenant("Duration Salon")
+    self._book(tenant_id, monday.replace(hour=9), self._service_id(tenant_id))
+    self.assertEqual(self._check(tenant_id, monday.replace(hour=9, minute=40))["reason"], "slot already booked")
+
+    db = self.api.SessionLocal()
+    try:
+      db.query(self.api.Service).filter_by(tenant_id=tenant_id, name="Braids").one().duration_minutes = 30
+      db.commit()
+    finally:
+      db.close()
+    self.assertTrue(self._check(tenant_id, monday.replace(hour=9, minute=40))["available"])
+
+  def test_past_days_are_evicted(self):
+    api = self.api
+    monday = self._next_monday()
+    tenant_id = self._create_tenant("Evicting Salon")
+    appointment_id = self._book(tenant_id, monday.replace(hour=9))
+    db = api.SessionLocal()
+    original = api.tenant_now_from_profile
+    try:
+      tenant = db.get(api.Tenant, tenant_id)
+      profile = tenant.business_profile
+      state = api._AVAILABILITY_ENGINE._state(db, tenant, profile)
+      self.assertIn(monday.date(), state["days"])
+      api.tenant_now_from_profile = lambda p: monday + timedelta(days=3)
+      state = api._AVAILABILITY_ENGINE._state(db, tenant, profile)
+    finally:
+      api.tenant_now_from_profile = original
+      db.close()
+    self.assertNotIn(monday.date(), state["days"])
+    self.assertNotIn(appointment_id, state["by_id"])
+
+  def test_warm_checks_skip_the_database(self):
+    api = self.api
+    monday = self._next_monday()
+    tenant_id = self._create_tenant("Warm Salon")
+    self._book(tenant_id, monday.replace(hour=9))
+    db = api.SessionLocal()
+    try:
+      tenant = db.get(api.Tenant, tenant_id)
+      profile = tenant.business_profile
+      api._AVAILABILITY_ENGINE.check(db, tenant, profile, monday.replace(hour=10), "Trim")
+
+      statements = []
+
+      def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+      api.event.listen(api.engine, "before_cursor_execute", count)
+      try:
+        for minute in range(0, 120, 5):
+          api._AVAILABILITY_ENGINE.check(db, tenant, profile, monday.replace(hour=10) + timedelta(minutes=minute), "Trim")
+        slots = api._AVAILABILITY_ENGINE.next_free(db, tenant, profile, monday, "Trim", count=5)
+      finally:
+        api.event.remove(api.engine, "before_cursor_execute", count)
+    finally:
+      db.close()
+    self.assertEqual(statements, [])
+    self.assertEqual(slots[0], monday.replace(hour=9, minute=45))
+
+  def test_tool_actions_return_alternatives(self):
+    api = self.api
+    monday = self._next_monday()
+    tenant_id = self._create_tenant("Tool Salon")
+    self._book(tenant_id, monday.replace(hour=9))
+    db = api.SessionLocal()
+    try:
+      tenant = db.get(api.Tenant, tenant_id)
+      taken = api._tool_check_availability(db, tenant, tenant.business_profile, monday.replace(hour=9).isoformat(), "Trim")
+      self.assertEqual(taken["available"], False)
+      self.assertEqual(taken["alternatives"][0], monday.replace(hour=9, minute=45).isoformat())
+      self.assertEqual(len(taken["alternatives"]), 3)
+
+      free = api._tool_check_availability(db, tenant, tenant.business_profile, monday.replace(hour=11).isoformat())
+      self.assertEqual(free, {"type": "CHECK_AVAILABILITY", "ok": True, "available": True})
+
+      found = api._tool_find_available_slots(
+        db, tenant, tenant.business_profile,
+        {"service_name": "Braids", "after_iso": monday.replace(hour=13).isoformat(), "count": 2},
+      )
+      self.assertEqual(found["slots"], [monday.replace(hour=13).isoformat(), monday.replace(hour=14, minute=30).isoformat()])
+      bad = api._tool_find_available_slots(db, tenant, tenant.business_profile, {"after_iso": "soon"})
+      self.assertFalse(bad["ok"])
+    finally:
+      db.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
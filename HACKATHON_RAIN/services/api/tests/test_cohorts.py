@@ -0,0 +1,88 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class CohortTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _book(self, tenant_id: int, phone: str, start: datetime) -> int:
+    resp = self.client.post(
+      f"/tenants/{tenant_id}/appointments",
+      json={"customer_phone": phone, "start_time": start.isoformat()},
+    )
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def test_repeat_rate_counts_customers_with_more_than_one_visit(self):
+    tenant_id = self._create_tenant("Cohort Shop")
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    self._book(tenant_id, "+2348000000001", now - timedelta(days=200))
+    self._book(tenant_id, "+2348000000001", now - timedelta(days=180))
+    self._book(tenant_id, "+2348000000002", now - timedelta(days=150))
+    self._book(tenant_id, "+2348000000003", now - timedelta(days=5))
+
+    body = self.client.get(f"/tenants/{tenant_id}/cohorts").get_json()
+    self.assertEqual((body["customers"], body["repeat_customers"]), (3, 1))
+    self.assertEqual(body["repeat_rate"], 33.3)
+    self.assertEqual(body["avg_days_between_visits"], 20.0)
+    # Customers 1 and 2 are older than the churn window and haven't been back.
+    self.assertEqual((body["churned_customers"], body["churn_rate"]), (2, 100.0))
+    self.assertEqual(sum(c["customers"] for c in body["cohorts"]), 3)
+    self.assertTrue(all(c["retention"][0] == 100.0 for c in body["cohorts"]))
+
+    analytics = self.client.get(f"/tenants/{tenant_id}/analytics").get_json()
+    self.assertEqual(analytics["repeat_customers"], 1)
+
+  def test_new_bookings_refresh_incrementally_and_cancellations_recompute(self):
+    engine = self.api._COHORT_ENGINE
+    tenant_id = self._create_tenant("Cohort Refresh Shop")
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    first = self._book(tenant_id, "+2348000000009", now - timedelta(days=10))
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/cohorts").get_json()["repeat_customers"], 0)
+
+    full_before = engine.full_refreshes
+    self._book(tenant_id, "+2348000000009", now - timedelta(days=3))
+    body = self.client.get(f"/tenants/{tenant_id}/cohorts").get_json()
+    self.assertEqual(body["repeat_customers"], 1)
+    self.assertEqual(engine.full_refreshes, full_before)
+
+    self.client.patch(f"/appointments/{first}", json={"status": "cancelled"})
+    body = self.client.get(f"/tenants/{tenant_id}/cohorts").get_json()
+    self.assertEqual((body["customers"], body["repeat_customers"]), (1, 0))
+    self.assertEqual(engine.full_refreshes, full_before + 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
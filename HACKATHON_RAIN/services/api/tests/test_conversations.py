@@ -0,0 +1,233 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class ConversationsIndexTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+    # Unreachable AI service: replies take the friendly error path, which is all the inbox needs.
+    os.environ["AI_SERVICE_URL"] = "http://127.0.0.1:9"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _chat(self, tenant_id: int, phone: str, text: str) -> None:
+    resp = self.client.post(
+      "/demo/chat", json={"tenant_id": tenant_id, "message": text, "customer_phone": phone, "customer_name": "Ada"}
+    )
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+
+  def _inbox(self, tenant_id: int, query: str = "") -> list:
+    resp = self.client.get(f"/tenants/{tenant_id}/conversations{query}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    return resp.get_json()
+
+  def test_inbox_tracks_messages_and_unread_counts(self):
+    tenant_id = self._create_tenant("Inbox Shop")
+    self.assertEqual(self._inbox(tenant_id), [])
+    self._chat(tenant_id, "+2348011111111", "hello")
+    self._chat(tenant_id, "+2348011111111", "are you open?")
+    self._chat(tenant_id, "+2348022222222", "hi")
+
+    inbox = self._inbox(tenant_id)
+    self.assertEqual([c["customer_phone"] for c in inbox], ["+2348022222222", "+2348011111111"])
+    self.assertEqual([c["unread_count"] for c in inbox], [1, 2])
+    self.assertEqual(inbox[1]["last_direction"], "out")
+    self.assertEqual(inbox[1]["state_mode"], "idle")
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/stats").get_json()["unread_conversations"], 2)
+
+    first_customer = inbox[1]["customer_id"]
+    resp = self.client.post(f"/tenants/{tenant_id}/conversations/{first_customer}/read")
+    self.assertEqual(resp.status_code, 200)
+    inbox = self._inbox(tenant_id)
+    self.assertEqual(inbox[1]["unread_count"], 0)
+    self.assertIsNotNone(inbox[1]["last_read_at"])
+
+    self._chat(tenant_id, "+2348011111111", "one more thing")
+    inbox = self._inbox(tenant_id)
+    self.assertEqual((inbox[0]["customer_id"], inbox[0]["unread_count"]), (first_customer, 1))
+
+  def test_inbox_pages_with_a_single_query(self):
+    tenant_id = self._create_tenant("Paged Inbox Shop")
+    for i in range(5):
+      self._chat(tenant_id, f"+23480333333{i:02d}", f"message {i}")
+    self._inbox(tenant_id)
+
+    api = self.api
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+      if "FROM conversations" in statement or "FROM messages" in statement:
+        statements.append(statement)
+
+    api.event.listen(api.engine, "before_cursor_execute", count)
+    try:
+      resp = self.client.get(f"/tenants/{tenant_id}/conversations?limit=2")
+    finally:
+      api.event.remove(api.engine, "before_cursor_execute", count)
+    self.assertEqual(len(statements), 1)
+    self.assertNotIn("FROM messages", statements[0])
+
+    seen = [c["customer_phone"] for c in resp.get_json()]
+    cursor = resp.headers.get("X-Next-Cursor")
+    while cursor:
+      resp = self.client.get(f"/tenants/{tenant_id}/conversations?limit=2&cursor={cursor}")
+      self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+      seen.extend(c["customer_phone"] for c in resp.get_json())
+      cursor = resp.headers.get("X-Next-Cursor")
+    self.assertEqual(seen, [f"+23480333333{i:02d}" for i in reversed(range(5))])
+
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/conversations?cursor=bogus").status_code, 400)
+
+  def test_index_is_rebuilt_from_existing_messages(self):
+    tenant_id = self._create_tenant("Legacy Inbox Shop")
+    api = self.api
+    now = datetime.utcnow()
+    db = api.SessionLocal()
+    try:
+      busy = api.Customer(tenant_id=tenant_id, phone="+2348044444444", name="Busy")
+      quiet = api.Customer(tenant_id=tenant_id, phone="+2348055555555")
+      db.add_all([busy, quiet])
+      db.flush()
+      db.add(api.Message(tenant_id=tenant_id, customer_id=quiet.id, direction="in", text="old question",
+                         created_at=now - timedelta(days=2)))
+      db.add_all(
+        [
+          api.Message(tenant_id=tenant_id, customer_id=busy.id, direction="in" if i % 2 else "out", text=f"m{i}",
+                      created_at=now - timedelta(days=1) + timedelta(seconds=i))
+          for i in range(600)
+        ]
+      )
+      db.add(api.ConversationRead(tenant_id=tenant_id, customer_id=busy.id,
+                                  last_read_at=now - timedelta(days=1) + timedelta(seconds=590)))
+      db.add(api.CustomerState(tenant_id=tenant_id, customer_phone=quiet.phone, state={"mode": "awaiting_time"}))
+      db.commit()
+      busy_id, quiet_id = busy.id, quiet.id
+    finally:
+      db.close()
+
+    inbox = self._inbox(tenant_id)
+    self.assertEqual([c["customer_id"] for c in inbox], [busy_id, quiet_id])
+    self.assertEqual((inbox[0]["customer_name"], inbox[0]["last_message"], inbox[0]["unread_count"]), ("Busy", "m599", 5))
+    self.assertEqual((inbox[1]["customer_name"], inbox[1]["unread_count"]), ("+2348055555555", 1))
+    self.assertEqual(inbox[1]["state_mode"], "awaiting_time")
+
+    db = api.SessionLocal()
+    try:
+      last_id = db.query(api.Message.id).filter_by(tenant_id=tenant_id, text="m599").scalar()
+    finally:
+      db.close()
+    self.assertEqual(self.client.delete(f"/messages/{last_id}").status_code, 200)
+    inbox = self._inbox(tenant_id)
+    self.assertEqual((inbox[0]["last_message"], inbox[0]["unread_count"]), ("m598", 4))
+
+  def test_rebuild_upserts_rows_a_concurrent_writer_added(self):
+    api = self.api
+    tenant_id = self._create_tenant("Racing Inbox Shop")
+    now = datetime.utcnow()
+    db = api.SessionLocal()
+    try:
+      customer = api.Customer(tenant_id=tenant_id, phone="+2348066666666")
+      db.add(customer)
+      db.flush()
+      db.add(api.Message(tenant_id=tenant_id, customer_id=customer.id, direction="in", text="hello", created_at=now))
+      db.add(api.Message(tenant_id=tenant_id, direction="in", text="anon", created_at=now))
+      db.commit()
+      customer_id = customer.id
+    finally:
+      db.close()
+
+    def race(conn, cursor, statement, parameters, context, executemany):
+      # Stands in for a _conversation_row insert the DELETE did not see.
+      if statement.startswith("DELETE FROM conversations"):
+        for cid in (customer_id, None):
+          cursor.execute(
+            "INSERT INTO conversations (tenant_id, customer_id, unread_count, state_mode) VALUES (?, ?, 0, 'idle')",
+            (tenant_id, cid),
+          )
+
+    db = api.SessionLocal()
+    api.event.listen(api.engine, "after_cursor_execute", race)
+    try:
+      self.assertEqual(api.rebuild_conversations(db, tenant_id), 2)
+    finally:
+      api.event.remove(api.engine, "after_cursor_execute", race)
+    try:
+      db.commit()
+      rows = {c.customer_id: (c.last_message, c.unread_count) for c in db.query(api.Conversation).filter_by(tenant_id=tenant_id)}
+    finally:
+      db.close()
+    self.assertEqual(rows, {customer_id: ("hello", 1), None: ("anon", 0)})
+
+  def test_one_anonymous_conversation_per_tenant(self):
+    api = self.api
+    tenant_id = self._create_tenant("Anonymous Inbox Shop")
+    db = api.SessionLocal()
+    try:
+      first = api._conversation_row(db, tenant_id, None)
+      # A concurrent request that missed the SELECT inserts again.
+      db.execute(
+        api.text(
+          "INSERT INTO conversations (tenant_id, customer_id, unread_count, state_mode) "
+          "VALUES (:tenant_id, NULL, 0, 'idle') ON CONFLICT DO NOTHING"
+        ),
+        {"tenant_id": tenant_id},
+      )
+      self.assertEqual(api._conversation_row(db, tenant_id, None).id, first.id)
+      db.commit()
+      count = db.query(api.Conversation).filter_by(tenant_id=tenant_id, customer_id=None).count()
+    finally:
+      db.close()
+    self.assertEqual(count, 1)
+
+  def test_migration_collapses_duplicate_anonymous_conversations(self):
+    api = self.api
+    tenant_id = self._create_tenant("Duplicate Inbox Shop")
+    with api.engine.begin() as conn:
+      conn.exec_driver_sql("DROP INDEX uq_conversation_tenant_anonymous")
+      for _ in range(3):
+        conn.execute(
+          api.Conversation.__table__.insert().values(tenant_id=tenant_id, customer_id=None, unread_count=0)
+        )
+      api._anonymous_conversation_index(conn, api.engine.dialect.name)
+    db = api.SessionLocal()
+    try:
+      count = db.query(api.Conversation).filter_by(tenant_id=tenant_id, customer_id=None).count()
+      rebuilt = db.get(api.Tenant, tenant_id).conversations_built_at
+    finally:
+      db.close()
+    self.assertEqual(count, 1)
+    self.assertIsNone(rebuilt)
+    self.assertEqual(self._inbox(tenant_id), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
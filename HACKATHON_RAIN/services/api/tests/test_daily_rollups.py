@@ -0,0 +1,208 @@
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+
+class DailyRollupTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed(self, tenant_id: int) -> dict:
+    api = self.api
+    db = api.SessionLocal()
+    try:
+      customers = [api.Customer(tenant_id=tenant_id, phone=f"+23480000000{i}") for i in range(2)]
+      service = api.Service(tenant_id=tenant_id, name="Haircut")
+      db.add_all(customers + [service])
+      db.flush()
+      db.add_all(
+        [
+          api.Message(tenant_id=tenant_id, customer_id=customers[0].id, direction="in", text="hi"),
+          api.Message(tenant_id=tenant_id, customer_id=customers[0].id, direction="out", text="hello"),
+          api.Message(tenant_id=tenant_id, customer_id=customers[1].id, direction="in", text="hey"),
+          api.Message(
+            tenant_id=tenant_id, customer_id=customers[1].id, direction="in", text="old",
+            created_at=datetime.utcnow() - timedelta(days=3),
+          ),
+          api.Order(tenant_id=tenant_id, status="confirmed", total_amount=5000),
+          api.Order(tenant_id=tenant_id, status="pending", total_amount=9000),
+          api.Complaint(tenant_id=tenant_id, complaint_details="late"),
+        ]
+      )
+      slot = datetime.utcnow().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+      appts = [
+        api.Appointment(tenant_id=tenant_id, service_id=service.id, start_time=slot + timedelta(hours=i))
+        for i in range(3)
+      ]
+      db.add_all(appts)
+      db.commit()
+      return {"appointment_ids": [a.id for a in appts]}
+    finally:
+      db.close()
+
+  def _rollup_snapshot(self, tenant_id: int) -> dict:
+    db = self.api.SessionLocal()
+    try:
+      rows = db.query(self.api.TenantDailyRollup).filter_by(tenant_id=tenant_id).all()
+      return {
+        r.day: (r.messages_in, r.messages_out, r.conversations, r.bookings, r.complaints, r.orders, r.revenue,
+                r.bookings_by_hour, r.bookings_by_service)
+        for r in rows
+      }
+    finally:
+      db.close()
+
+  def test_stats_are_served_from_incremental_rollups(self):
+    tenant_id = self._create_tenant("Rollup Shop")
+    # Build (empty) rollups first so everything below is applied incrementally.
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/stats").get_json()["messages_today"], 0)
+    seeded = self._seed(tenant_id)
+
+    self.client.patch(f"/appointments/{seeded['appointment_ids'][0]}", json={"status": "cancelled"})
+    db = self.api.SessionLocal()
+    try:
+      order = db.query(self.api.Order).filter_by(tenant_id=tenant_id, status="pending").one()
+      order.status = "fulfilled"
+      db.commit()
+    finally:
+      db.close()
+
+    stats = self.client.get(f"/tenants/{tenant_id}/stats").get_json()
+    self.assertEqual(stats["messages_today"], 3)
+    self.assertEqual(stats["conversations_today"], 2)
+    self.assertEqual(stats["total_appointments"], 2)
+    self.assertEqual(stats["total_complaints"], 1)
+    self.assertEqual((stats["most_requested_service_name"], stats["most_requested_service_count"]), ("Haircut", 2))
+
+    analytics = self.client.get(f"/tenants/{tenant_id}/analytics").get_json()
+    self.assertEqual(analytics["revenue_30_days"], 140.0)
+    self.assertEqual(analytics["popular_services"], [{"service": "Haircut", "bookings": 2}])
+    self.assertEqual(len(analytics["peak_hours"]), 2)
+
+    # Incremental maintenance agrees with a rebuild from the raw tables.
+    incremental = self._rollup_snapshot(tenant_id)
+    db = self.api.SessionLocal()
+    try:
+      self.api.rebuild_daily_rollups(db, tenant_id)
+      db.commit()
+    finally:
+      db.close()
+    self.assertEqual(self._rollup_snapshot(tenant_id), incremental)
+
+  def test_bulk_delete_triggers_rebuild(self):
+    tenant_id = self._create_tenant("Rollup Reset Shop")
+    self._seed(tenant_id)
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/stats").get_json()["messages_today"], 3)
+
+    self.client.delete(f"/tenants/{tenant_id}/messages")
+    self.api.schedule_rollup_rebuild(tenant_id).result(timeout=10)
+    stats = self.client.get(f"/tenants/{tenant_id}/stats").get_json()
+    self.assertEqual((stats["messages_today"], stats["conversations_today"]), (0, 0))
+    self.assertEqual(stats["total_appointments"], 3)
+
+    resp = self.client.get(f"/tenants/{tenant_id}/optimization-suggestions")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+
+  def test_deleting_a_message_adjusts_todays_counts(self):
+    api = self.api
+    tenant_id = self._create_tenant("Rollup Delete Shop")
+    self._seed(tenant_id)
+    db = api.SessionLocal()
+    try:
+      today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+      ids = {
+        m.text: m.id
+        for m in db.query(api.Message).filter(api.Message.tenant_id == tenant_id, api.Message.created_at >= today)
+      }
+    finally:
+      db.close()
+
+    self.assertEqual(self.client.delete(f"/messages/{ids['hello']}").status_code, 200)
+    stats = self.client.get(f"/tenants/{tenant_id}/stats").get_json()
+    self.assertEqual((stats["messages_today"], stats["conversations_today"]), (2, 2))
+
+    # The second customer's only message today: their conversation goes too.
+    self.assertEqual(self.client.delete(f"/messages/{ids['hey']}").status_code, 200)
+    stats = self.client.get(f"/tenants/{tenant_id}/stats").get_json()
+    self.assertEqual((stats["messages_today"], stats["conversations_today"]), (1, 1))
+
+    incremental = self._rollup_snapshot(tenant_id)
+    db = api.SessionLocal()
+    try:
+      api.rebuild_daily_rollups(db, tenant_id)
+      db.commit()
+    finally:
+      db.close()
+    self.assertEqual(self._rollup_snapshot(tenant_id), incremental)
+
+  def test_stats_reads_do_not_write(self):
+    api = self.api
+    tenant_id = self._create_tenant("Rollup Read Shop")
+    self._seed(tenant_id)
+    db = api.SessionLocal()
+    try:
+      tenant = db.get(api.Tenant, tenant_id)
+      tenant.rollups_built_at = None
+      tenant.conversations_built_at = None
+      db.commit()
+    finally:
+      db.close()
+
+    writes = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+      if statement.startswith("SELECT"):
+        return
+      if any(name in statement for name in ("tenant_daily", "rollups_built_at", "conversations")):
+        writes.append((threading.current_thread().name, " ".join(statement.split()[:3])))
+
+    api.event.listen(api.engine, "before_cursor_execute", count)
+    try:
+      resp = self.client.get(f"/tenants/{tenant_id}/stats")
+      api.schedule_rollup_rebuild(tenant_id).result(timeout=10)
+      api.schedule_conversations_rebuild(tenant_id).result(timeout=10)
+    finally:
+      api.event.remove(api.engine, "before_cursor_execute", count)
+    self.assertEqual(resp.status_code, 200)
+    # The request only read; both rebuilds ran on the background thread.
+    self.assertTrue(writes)
+    self.assertTrue(all(name.startswith("rollup-rebuild") for name, _ in writes), writes)
+    self.assertIn("INSERT INTO conversations", [statement for _, statement in writes])
+    stats = self.client.get(f"/tenants/{tenant_id}/stats").get_json()
+    self.assertEqual(stats["messages_today"], 3)
+    self.assertEqual(stats["unread_conversations"], 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
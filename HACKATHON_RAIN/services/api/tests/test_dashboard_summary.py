@@ -0,0 +1,130 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class DashboardSummaryTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed(self, tenant_id: int) -> None:
+    api = self.api
+    db = api.SessionLocal()
+    try:
+      customer = api.Customer(tenant_id=tenant_id, phone="+2348000000001")
+      service = api.Service(tenant_id=tenant_id, name="Braids")
+      db.add_all([customer, service])
+      db.flush()
+      db.add_all(
+        [
+          api.Message(tenant_id=tenant_id, customer_id=customer.id, direction="in", text="great service, thanks",
+                      sentiment_score=api.score_sentiment("great service, thanks")),
+          api.Message(tenant_id=tenant_id, customer_id=customer.id, direction="out", text="you're welcome"),
+          api.Order(tenant_id=tenant_id, status="confirmed", total_amount=4000),
+        ]
+      )
+      slot = datetime.utcnow().replace(hour=11, minute=0, second=0, microsecond=0) + timedelta(days=1)
+      db.add_all(
+        [
+          api.Appointment(tenant_id=tenant_id, service_id=service.id, customer_id=customer.id,
+                          start_time=slot + timedelta(days=i))
+          for i in range(2)
+        ]
+      )
+      db.commit()
+    finally:
+      db.close()
+
+  def _count_statements(self, path: str) -> tuple:
+    api = self.api
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+      statements.append(statement)
+
+    api.event.listen(api.engine, "before_cursor_execute", count)
+    try:
+      resp = self.client.get(path)
+    finally:
+      api.event.remove(api.engine, "before_cursor_execute", count)
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    return resp.get_json(), len(statements)
+
+  def test_summary_matches_individual_endpoints(self):
+    tenant_id = self._create_tenant("Summary Shop")
+    self._seed(tenant_id)
+
+    summary = self.client.get(f"/tenants/{tenant_id}/dashboard-summary").get_json()
+    self.assertEqual(
+      set(summary),
+      {"stats", "analytics", "sentiment", "optimization", "conversations", "generated_at", "cached"},
+    )
+    self.assertEqual(summary["stats"], self.client.get(f"/tenants/{tenant_id}/stats").get_json())
+    self.assertEqual(summary["analytics"], self.client.get(f"/tenants/{tenant_id}/analytics").get_json())
+    self.assertEqual(summary["sentiment"], self.client.get(f"/tenants/{tenant_id}/sentiment-analysis").get_json())
+    self.assertEqual(
+      summary["optimization"], self.client.get(f"/tenants/{tenant_id}/optimization-suggestions").get_json()
+    )
+    self.assertEqual(summary["conversations"], self.client.get(f"/tenants/{tenant_id}/conversations").get_json())
+
+  def test_payload_is_cached_until_tenant_data_changes(self):
+    tenant_id = self._create_tenant("Cached Summary Shop")
+    self._seed(tenant_id)
+    path = f"/tenants/{tenant_id}/dashboard-summary"
+
+    first, cold = self._count_statements(path)
+    second, warm = self._count_statements(path)
+    self.assertFalse(first["cached"])
+    self.assertTrue(second["cached"])
+    self.assertLess(warm, cold)
+    self.assertEqual(second["generated_at"], first["generated_at"])
+
+    db = self.api.SessionLocal()
+    try:
+      customer = db.query(self.api.Customer).filter_by(tenant_id=tenant_id).first()
+      db.add(self.api.Message(tenant_id=tenant_id, customer_id=customer.id, direction="in", text="one more"))
+      db.commit()
+    finally:
+      db.close()
+
+    third = self.client.get(path).get_json()
+    self.assertFalse(third["cached"])
+    self.assertEqual(third["stats"]["messages_today"], first["stats"]["messages_today"] + 1)
+
+  def test_unknown_tenant(self):
+    resp = self.client.get("/tenants/999999/dashboard-summary")
+    self.assertEqual(resp.status_code, 404)
+
+
+if __name__ == "__main__":
+  unittest.main()
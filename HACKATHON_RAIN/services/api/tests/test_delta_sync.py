@@ -0,0 +1,133 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+
+class DeltaSyncTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _add_messages(self, tenant_id: int, texts: list) -> list:
+    db = self.api.SessionLocal()
+    try:
+      rows = [self.api.Message(tenant_id=tenant_id, direction="in", text=t) for t in texts]
+      db.add_all(rows)
+      db.commit()
+      return [r.id for r in rows]
+    finally:
+      db.close()
+
+  def test_delta_returns_only_changes_since_cursor(self):
+    tenant_id = self._create_tenant("Delta Shop")
+    resp = self.client.post(f"/tenants/{tenant_id}/complaints", json={"complaint_details": "Cold food"})
+    first_id = resp.get_json()["id"]
+
+    listing = self.client.get(f"/tenants/{tenant_id}/complaints")
+    self.assertEqual(listing.status_code, 200)
+    cursor = listing.headers["X-Sync-Cursor"]
+
+    empty = self.client.get(f"/tenants/{tenant_id}/complaints?since={cursor}").get_json()
+    self.assertEqual((empty["items"], empty["deleted"], empty["full"]), ([], [], False))
+
+    second_id = self.client.post(f"/tenants/{tenant_id}/complaints", json={"complaint_details": "Late"}).get_json()["id"]
+    self.client.patch(f"/complaints/{first_id}", json={"status": "Resolved"})
+    delta = self.client.get(f"/tenants/{tenant_id}/complaints?since={cursor}").get_json()
+    self.assertFalse(delta["full"])
+    self.assertEqual(sorted(c["id"] for c in delta["items"]), sorted([first_id, second_id]))
+    self.assertNotEqual(delta["cursor"], cursor)
+
+    again = self.client.get(f"/tenants/{tenant_id}/complaints?since={delta['cursor']}").get_json()
+    self.assertEqual(again["items"], [])
+
+  def test_etag_returns_304_until_something_changes(self):
+    tenant_id = self._create_tenant("Etag Shop")
+    self._add_messages(tenant_id, ["hi"])
+    first = self.client.get(f"/tenants/{tenant_id}/messages")
+    etag = first.headers["ETag"]
+    self.assertTrue(etag.startswith("W/"))
+
+    cached = self.client.get(f"/tenants/{tenant_id}/messages", headers={"If-None-Match": etag})
+    self.assertEqual(cached.status_code, 304)
+
+    self._add_messages(tenant_id, ["hello again"])
+    fresh = self.client.get(f"/tenants/{tenant_id}/messages", headers={"If-None-Match": etag})
+    self.assertEqual(fresh.status_code, 200)
+    self.assertEqual(len(fresh.get_json()), 2)
+
+  def test_deletes_are_sent_as_tombstones_and_bulk_deletes_force_full(self):
+    tenant_id = self._create_tenant("Tombstone Shop")
+    ids = self._add_messages(tenant_id, ["a", "b", "c"])
+    cursor = self.client.get(f"/tenants/{tenant_id}/messages").headers["X-Sync-Cursor"]
+
+    self.assertEqual(self.client.delete(f"/messages/{ids[0]}").status_code, 200)
+    delta = self.client.get(f"/tenants/{tenant_id}/messages?since={cursor}").get_json()
+    self.assertEqual((delta["items"], delta["deleted"], delta["full"]), ([], [ids[0]], False))
+
+    self.client.delete(f"/tenants/{tenant_id}/messages")
+    after_reset = self.client.get(f"/tenants/{tenant_id}/messages?since={delta['cursor']}").get_json()
+    self.assertTrue(after_reset["full"])
+    self.assertEqual(after_reset["items"], [])
+
+  def test_appointment_delta_hides_duplicate_slots_like_the_snapshot(self):
+    api = self.api
+    tenant_id = self._create_tenant("Slot Delta Shop")
+    slot = "2031-05-05T10:00:00"
+    older = self.client.post(f"/tenants/{tenant_id}/appointments", json={"start_time": slot}).get_json()["id"]
+    cursor = self.client.get(f"/tenants/{tenant_id}/appointments").headers["X-Sync-Cursor"]
+
+    # A retried booking for the same slot, written past the POST route's dedupe.
+    db = api.SessionLocal()
+    try:
+      retry = api.Appointment(tenant_id=tenant_id, start_time=api.datetime.fromisoformat(slot), customer_name="retry")
+      db.add(retry)
+      db.commit()
+      newer = retry.id
+    finally:
+      db.close()
+
+    delta = self.client.get(f"/tenants/{tenant_id}/appointments?since={cursor}").get_json()
+    self.assertEqual(([a["id"] for a in delta["items"]], delta["deleted"]), ([newer], [older]))
+    snapshot = self.client.get(f"/tenants/{tenant_id}/appointments").get_json()
+    self.assertEqual([a["id"] for a in snapshot], [newer])
+
+    self.client.patch(f"/appointments/{older}", json={"status": "confirmed"})
+    later = self.client.get(f"/tenants/{tenant_id}/appointments?since={delta['cursor']}").get_json()
+    self.assertEqual((later["items"], later["deleted"]), ([], [older]))
+
+  def test_invalid_cursor_is_rejected(self):
+    tenant_id = self._create_tenant("Bad Cursor Shop")
+    resp = self.client.get(f"/tenants/{tenant_id}/orders?since=not-a-cursor")
+    self.assertEqual(resp.status_code, 400)
+
+
+if __name__ == "__main__":
+  unittest.main()
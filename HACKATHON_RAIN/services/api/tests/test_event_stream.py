@@ -0,0 +1,210 @@
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+
+class EventStreamTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+    os.environ["EVENT_BUS_BACKEND"] = "memory"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _read_events(self, resp, count: int) -> list:
+    events = []
+    buf = ""
+    for chunk in resp.response:
+      buf += chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+      while "\n\n" in buf:
+        block, buf = buf.split("\n\n", 1)
+        for line in block.splitlines():
+          if line.startswith("data: "):
+            events.append(json.loads(line[len("data: "):]))
+      if len(events) >= count:
+        break
+    resp.close()
+    return events
+
+  def test_event_ids_are_per_tenant_and_ordered(self):
+    a = self._create_tenant("Bus Shop A")
+    b = self._create_tenant("Bus Shop B")
+    base_a = len(self.api.EVENT_BUS.events_after(a, 0))
+    for i in range(3):
+      self.api.publish_event(a, "ping", {"n": i})
+    self.api.publish_event(b, "ping", {"n": 0})
+
+    ids_a = [e["id"] for e in self.api.EVENT_BUS.events_after(a, 0)][base_a:]
+    self.assertEqual(ids_a, sorted(ids_a))
+    self.assertEqual(len(set(ids_a)), 3)
+    self.assertEqual([e["payload"]["n"] for e in self.api.EVENT_BUS.events_after(a, ids_a[0])], [1, 2])
+    self.assertTrue(all(e["type"] == "ping" for e in self.api.EVENT_BUS.events_after(b, 0)[-1:]))
+
+  def test_stream_resumes_after_last_event_id(self):
+    tenant_id = self._create_tenant("Resume Shop")
+    for i in range(4):
+      self.api.publish_event(tenant_id, "ping", {"n": i})
+    ids = [e["id"] for e in self.api.EVENT_BUS.events_after(tenant_id, 0) if e["type"] == "ping"]
+
+    resp = self.client.get(f"/tenants/{tenant_id}/events", headers={"Last-Event-ID": str(ids[1])}, buffered=False)
+    self.assertEqual(resp.status_code, 200)
+    events = self._read_events(resp, 2)
+    self.assertEqual([e["payload"]["n"] for e in events], [2, 3])
+
+  def test_waiting_subscriber_is_woken_by_publish(self):
+    tenant_id = self._create_tenant("Wakeup Shop")
+    last_id = max([e["id"] for e in self.api.EVENT_BUS.events_after(tenant_id, 0)] or [0])
+    received = {}
+
+    def subscriber():
+      t0 = time.perf_counter()
+      received["events"] = self.api.EVENT_BUS.wait_for_events(tenant_id, last_id, timeout=5)
+      received["elapsed"] = time.perf_counter() - t0
+
+    thread = threading.Thread(target=subscriber)
+    thread.start()
+    time.sleep(0.1)
+    self.api.publish_event(tenant_id, "booking_created", {"n": 1})
+    thread.join(5)
+    self.assertEqual([e["type"] for e in received["events"]], ["booking_created"])
+    self.assertLess(received["elapsed"], 1.0)
+
+  def test_ring_lookup_after_wraparound_and_out_of_order_merge(self):
+    ring = self.api.EventRing(5)
+    with ring.cond:
+      for i in range(1, 9):
+        ring.append({"id": i})
+      self.assertEqual([e["id"] for e in ring.after(0)], [4, 5, 6, 7, 8])
+      self.assertEqual([e["id"] for e in ring.after(6)], [7, 8])
+      self.assertEqual(ring.after(8), [])
+      ring.append({"id": 10})
+      ring.append({"id": 9})
+      ring.append({"id": 9})
+      self.assertEqual([e["id"] for e in ring.after(0)], [6, 7, 8, 9, 10])
+
+  def test_restarted_bus_resumes_from_durable_log(self):
+    tenant_id = self._create_tenant("Durable Shop")
+    for i in range(5):
+      self.api.publish_event(tenant_id, "booking_created", {"n": i})
+    ids = [e["id"] for e in self.api.EVENT_BUS.events_after(tenant_id, 0) if e["type"] == "booking_created"]
+
+    # A fresh process: empty in-memory buffers, same log.
+    restarted = self.api.InMemoryEventBus(max_events=10, log=self.api.EVENT_LOG)
+    caught_up = restarted.events_after(tenant_id, ids[1])
+    self.assertEqual([e["payload"]["n"] for e in caught_up], [2, 3, 4])
+    restarted.publish(tenant_id, "booking_created", {"n": 5})
+    self.assertEqual(restarted.events_after(tenant_id, ids[-1])[0]["id"], ids[-1] + 1)
+
+    resp = self.client.get(f"/tenants/{tenant_id}/events/log?since={ids[2]}&limit=2")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    body = resp.get_json()
+    self.assertEqual([e["payload"]["n"] for e in body["events"]], [3, 4])
+    self.assertTrue(body["has_more"])
+
+  def test_resume_past_buffer_pages_through_log_in_order(self):
+    tenant_id = self._create_tenant("Long Disconnect Shop")
+    bus = self.api.InMemoryEventBus(max_events=10, log=self.api.EVENT_LOG)
+    for i in range(40):
+      bus.publish(tenant_id, "ping", {"n": i})
+    first = bus.events_after(tenant_id, 0)[0]["id"]
+    seen = []
+    last_id = first
+    while True:
+      batch = bus.events_after(tenant_id, last_id)
+      if not batch:
+        break
+      ids = [e["id"] for e in batch]
+      self.assertEqual(ids, list(range(last_id + 1, last_id + 1 + len(ids))))
+      seen.extend(ids)
+      last_id = ids[-1]
+    self.assertEqual(len(seen), 9)
+
+    original = self.api.EventLog.since
+    try:
+      self.api.EventLog.since = lambda self_, t, seq, limit=1000: original(self_, t, seq, limit=3)
+      restarted = self.api.InMemoryEventBus(max_events=10, log=self.api.EVENT_LOG)
+      got = []
+      last_id = first - 20
+      while True:
+        batch = restarted.events_after(tenant_id, last_id)
+        if not batch:
+          break
+        got.extend(e["id"] for e in batch)
+        last_id = batch[-1]["id"]
+    finally:
+      self.api.EventLog.since = original
+    self.assertEqual(got, list(range(first - 19, first + 10)))
+
+  def test_event_log_retention(self):
+    log = self.api.EventLog(self.api.EVENT_LOG.engine, retention_days=1, max_per_tenant=10)
+    tenant_id = self._create_tenant("Retention Shop")
+    for i in range(30):
+      log.append(tenant_id, "ping", {"n": i})
+    deleted = log.prune()
+    self.assertGreater(deleted["over_cap"], 0)
+    remaining = log.since(tenant_id, 0)
+    self.assertEqual(len(remaining), 10)
+    self.assertEqual(remaining[-1]["payload"]["n"], 29)
+
+    future = self.api.datetime.utcnow() + self.api.timedelta(days=2)
+    log.prune(now=future)
+    self.assertEqual(log.since(tenant_id, 0), [])
+
+  def test_buffer_is_bounded(self):
+    tenant_id = self._create_tenant("Busy Shop")
+    for i in range(self.api.EVENT_BUS.max_events + 25):
+      self.api.publish_event(tenant_id, "ping", {"n": i})
+    events = self.api.EVENT_BUS.events_after(tenant_id, 0)
+    self.assertEqual(len(events), self.api.EVENT_BUS.max_events)
+    self.assertEqual(events[-1]["payload"]["n"], self.api.EVENT_BUS.max_events + 24)
+
+  def test_backends_must_implement_publish(self):
+    with self.assertRaises(TypeError):
+      self.api.EventBus()
+
+    class Incomplete(self.api.EventBus):
+      pass
+
+    with self.assertRaises(TypeError):
+      Incomplete()
+
+  def test_remote_backends_must_implement_listen(self):
+    class NoListener(self.api._ListenerEventBus):
+      def publish(self, tenant_id, event_type, payload=None):
+        pass
+
+    with self.assertRaises(TypeError):
+      NoListener()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import importlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+
+class EventsGatewayTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+    os.environ["EVENT_BUS_BACKEND"] = "memory"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    for name in ("app", "events_gateway"):
+      if name in sys.modules:
+        del sys.modules[name]
+    cls.api = importlib.import_module("app")
+    cls.gateway_module = importlib.import_module("events_gateway")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _run(self, gateway, path, headers=None, query=b"", until=None, send_delay=0.0, timeout=5.0):
+    """
+    Drive the ASGI app until until(events) is true, then disconnect.
+    Returns (status, events).
+    """
+    state = {"status": None, "events": [], "buf": ""}
+
+    async def main():
+      disconnected = asyncio.Event()
+
+      async def receive():
+        if not state.get("requested"):
+          state["requested"] = True
+          return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+      async def send(message):
+        if message["type"] == "http.response.start":
+          state["status"] = message["status"]
+          return
+        if send_delay:
+          await asyncio.sleep(send_delay)
+        state["buf"] += message.get("body", b"").decode("utf-8")
+        while "\n\n" in state["buf"]:
+          block, state["buf"] = state["buf"].split("\n\n", 1)
+          for line in block.splitlines():
+            if line.startswith("data: "):
+              state["events"].append(json.loads(line[len("data: "):]))
+        if until is None or until(state["events"]):
+          disconnected.set()
+
+      scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+      }
+      await asyncio.wait_for(gateway(scope, receive, send), timeout)
+
+    asyncio.run(main())
+    return state["status"], state["events"]
+
+  def test_resume_from_last_event_id(self):
+    tenant_id = self._create_tenant("Gateway Resume Shop")
+    for i in range(4):
+      self.api.publish_event(tenant_id, "ping", {"n": i})
+    pings = [e for e in self.api.EVENT_BUS.events_after(tenant_id, 0) if e["type"] == "ping"]
+
+    gateway = self.gateway_module.EventsGateway(self.api.EVENT_BUS)
+    status, events = self._run(
+      gateway,
+      f"/tenants/{tenant_id}/events",
+      headers={"Last-Event-ID": str(pings[1]["id"])},
+      until=lambda evs: len(evs) >= 2,
+    )
+    self.assertEqual(status, 200)
+    self.assertEqual([e["payload"]["n"] for e in events], [2, 3])
+    self.assertEqual(gateway.connection_count(), 0)
+
+  def test_live_burst_reaches_slow_client_without_loss(self):
+    tenant_id = self._create_tenant("Gateway Burst Shop")
+    start_id = max([e["id"] for e in self.api.EVENT_BUS.events_after(tenant_id, 0)] or [0])
+    gateway = self.gateway_module.EventsGateway(self.api.EVENT_BUS, client_buffer=2)
+    burst = 40
+
+    def publish_burst():
+      for i in range(burst):
+        self.api.publish_event(tenant_id, "burst", {"n": i})
+
+    async def kick():
+      await asyncio.sleep(0.05)
+      await asyncio.get_running_loop().run_in_executor(None, publish_burst)
+
+    original_run = gateway._stream
+
+    async def stream_with_burst(*args, **kwargs):
+      task = asyncio.ensure_future(kick())
+      try:
+        await original_run(*args, **kwargs)
+      finally:
+        await task
+
+    gateway._stream = stream_with_burst
+    status, events = self._run(
+      gateway,
+      f"/tenants/{tenant_id}/events",
+      query=f"last_id={start_id}".encode(),
+      until=lambda evs: sum(1 for e in evs if e["type"] == "burst") >= burst,
+      send_delay=0.005,
+    )
+    self.assertEqual(status, 200)
+    ns = [e["payload"]["n"] for e in events if e["type"] == "burst"]
+    self.assertEqual(ns, list(range(burst)))
+
+  def test_auth_and_unknown_tenant(self):
+    gateway = self.gateway_module.EventsGateway(self.api.EVENT_BUS)
+    status, _ = self._run(gateway, "/tenants/999999/events")
+    self.assertEqual(status, 404)
+
+    tenant_id = self._create_tenant("Gateway Auth Shop")
+    os.environ["AUTH_REQUIRED"] = "1"
+    try:
+      status, _ = self._run(gateway, f"/tenants/{tenant_id}/events", query=b"token=bogus")
+    finally:
+      os.environ["AUTH_REQUIRED"] = "0"
+    self.assertEqual(status, 401)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,152 @@
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class ExportTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+    os.environ["ARCHIVE_DIR"] = os.path.join(cls._tmpdir.name, "archives")
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed_messages(self, tenant_id: int, count: int) -> None:
+    db = self.api.SessionLocal()
+    try:
+      db.add_all(
+        self.api.Message(tenant_id=tenant_id, direction="in" if i % 2 else "out", text=f'msg {i}, "quoted"')
+        for i in range(count)
+      )
+      db.commit()
+    finally:
+      db.close()
+
+  def test_csv_export_streams_every_row_in_batches(self):
+    tenant_id = self._create_tenant("Export Shop")
+    other = self._create_tenant("Other Export Shop")
+    self._seed_messages(tenant_id, 25)
+    self._seed_messages(other, 3)
+
+    batches = list(self.api.iter_export_batches("messages", ["id", "text"], tenant_id, None, None, batch_size=10))
+    self.assertEqual([len(b) for b in batches], [10, 10, 5])
+
+    resp = self.client.get(f"/tenants/{tenant_id}/export/messages", buffered=False)
+    self.assertEqual(resp.status_code, 200)
+    self.assertIn("attachment", resp.headers["Content-Disposition"])
+    chunks = []
+    for chunk in resp.response:
+      chunks.append(chunk)
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    self.assertEqual(rows[0][:4], ["id", "customer_id", "direction", "text"])
+    self.assertEqual(len(rows), 26)
+    self.assertEqual(rows[1][3], 'msg 0, "quoted"')
+
+  def test_gzip_ndjson_and_rollups(self):
+    tenant_id = self._create_tenant("Export Gzip Shop")
+    self._seed_messages(tenant_id, 4)
+
+    resp = self.client.get(f"/tenants/{tenant_id}/export/messages?format=ndjson&gzip=1")
+    self.assertEqual(resp.status_code, 200)
+    self.assertEqual(resp.mimetype, "application/gzip")
+    lines = gzip.decompress(resp.data).decode("utf-8").splitlines()
+    self.assertEqual([json.loads(line)["text"] for line in lines][0], 'msg 0, "quoted"')
+    self.assertEqual(len(lines), 4)
+
+    rollups = self.client.get(f"/tenants/{tenant_id}/export/daily_rollups?format=ndjson")
+    rows = [json.loads(line) for line in rollups.get_data(as_text=True).splitlines()]
+    self.assertEqual(sum(r["messages_in"] + r["messages_out"] for r in rows), 4)
+
+  def test_message_export_includes_archived_months(self):
+    tenant_id = self._create_tenant("Export Archive Shop")
+    old = datetime.utcnow() - timedelta(days=400)
+    db = self.api.SessionLocal()
+    try:
+      db.add_all(
+        self.api.Message(tenant_id=tenant_id, direction="in", text=f"old {i}", created_at=old + timedelta(minutes=i))
+        for i in range(3)
+      )
+      db.commit()
+      self.api.archive_old_months(db, older_than_months=6)
+      self.assertEqual(db.query(self.api.Message).filter_by(tenant_id=tenant_id).count(), 0)
+    finally:
+      db.close()
+    self._seed_messages(tenant_id, 2)
+
+    resp = self.client.get(f"/tenants/{tenant_id}/export/messages?format=ndjson")
+    self.assertEqual(resp.status_code, 200)
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    self.assertEqual([r["text"] for r in rows], ['msg 0, "quoted"', 'msg 1, "quoted"', "old 0", "old 1", "old 2"])
+    self.assertEqual(rows[2]["created_at"], old.isoformat())
+
+    ranged = self.client.get(
+      f"/tenants/{tenant_id}/export/messages?format=ndjson&from={(old + timedelta(minutes=1)).isoformat()}"
+      f"&to={(old + timedelta(days=1)).isoformat()}"
+    )
+    self.assertEqual([json.loads(line)["text"] for line in ranged.get_data(as_text=True).splitlines()], ["old 1", "old 2"])
+
+  def test_stale_rollups_export_without_waiting_for_the_rebuild(self):
+    tenant_id = self._create_tenant("Export Stale Shop")
+    self._seed_messages(tenant_id, 2)
+    db = self.api.SessionLocal()
+    try:
+      db.get(self.api.Tenant, tenant_id).rollups_built_at = None
+      db.commit()
+    finally:
+      db.close()
+    scheduled = []
+    original = self.api.schedule_rollup_rebuild
+    self.api.schedule_rollup_rebuild = lambda tid: scheduled.append(tid)
+    try:
+      resp = self.client.get(f"/tenants/{tenant_id}/export/daily_rollups?format=ndjson")
+    finally:
+      self.api.schedule_rollup_rebuild = original
+    self.assertEqual(resp.status_code, 200)
+    self.assertEqual(scheduled, [tenant_id])
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    self.assertEqual(sum(r["messages_in"] + r["messages_out"] for r in rows), 2)
+
+  def test_bad_dataset_and_format(self):
+    tenant_id = self._create_tenant("Export Errors Shop")
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/export/owners").status_code, 404)
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/export/orders?format=xlsx").status_code, 400)
+    try:
+      import pyarrow  # noqa: F401
+    except ImportError:
+      resp = self.client.get(f"/tenants/{tenant_id}/export/daily_rollups?format=parquet")
+      self.assertEqual(resp.status_code, 501)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,193 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+
+class HistoryArchiveTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+    os.environ["ARCHIVE_DIR"] = os.path.join(cls._tmpdir.name, "archives")
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.api.migrate_db(partition_tables=True)
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed(self, tenant_id: int, months_ago: list) -> tuple:
+    """
+    Two messages per entry of months_ago (0 = this month), alternating two
+    customers, plus one trace per month. Returns (customer ids, message ids).
+    """
+    api = self.api
+    this_month = api.month_start(datetime.utcnow())
+    db = api.SessionLocal()
+    try:
+      customers = [api.Customer(tenant_id=tenant_id, phone=f"+23480{tenant_id:04d}{i}") for i in range(2)]
+      db.add_all(customers)
+      db.flush()
+      messages = []
+      for months in months_ago:
+        at = api.month_start(this_month, -months) + timedelta(days=3)
+        for i, customer in enumerate(customers):
+          messages.append(api.Message(tenant_id=tenant_id, customer_id=customer.id, direction="in",
+                                      text=f"{months}m-{i}", created_at=at + timedelta(hours=i)))
+        db.add(api.AgentTrace(tenant_id=tenant_id, model_used="m", created_at=at))
+      db.add_all(messages)
+      db.commit()
+      return [c.id for c in customers], [m.id for m in messages]
+    finally:
+      db.close()
+
+  def _archive(self, months: int) -> list:
+    db = self.api.SessionLocal()
+    try:
+      return self.api.archive_old_months(db, older_than_months=months)
+    finally:
+      db.close()
+
+  def _walk(self, path: str, limit: int) -> list:
+    resp = self.client.get(f"{path}&limit={limit}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    items = resp.get_json()
+    while resp.headers.get("X-Next-Cursor"):
+      resp = self.client.get(f"{path}&limit={limit}&cursor={resp.headers['X-Next-Cursor']}")
+      self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+      items.extend(resp.get_json())
+    return items
+
+  def test_month_arithmetic(self):
+    month_start = self.api.month_start
+    self.assertEqual(month_start(datetime(2024, 1, 31, 15, 5)), datetime(2024, 1, 1))
+    self.assertEqual(month_start(datetime(2024, 1, 31), -1), datetime(2023, 12, 1))
+    self.assertEqual(month_start(datetime(2024, 11, 2), 3), datetime(2025, 2, 1))
+    self.assertEqual(self.api.month_partition_name("messages", datetime(2025, 2, 1)), "messages_p202502")
+
+  def test_old_months_move_to_archive_and_read_through(self):
+    api = self.api
+    tenant_id = self._create_tenant("Archive Shop")
+    other_id = self._create_tenant("Other Archive Shop")
+    customers, message_ids = self._seed(tenant_id, [0, 1, 4, 5])
+    self._seed(other_id, [6])
+
+    summary = self._archive(3)
+    archived = {(s["entity"], s["month"], s["rows"]) for s in summary}
+    this_month = api.month_start(datetime.utcnow())
+    for months, rows in ((4, 2), (5, 2)):
+      self.assertIn(("messages", f"{api.month_start(this_month, -months):%Y-%m}", rows), archived)
+    self.assertIn(("messages", f"{api.month_start(this_month, -6):%Y-%m}", 2), archived)
+    self.assertEqual(len([s for s in summary if s["entity"] == "agent_traces"]), 3)
+
+    db = api.SessionLocal()
+    try:
+      self.assertEqual(db.query(api.Message).filter_by(tenant_id=tenant_id).count(), 4)
+      self.assertEqual(db.query(api.AgentTrace).filter_by(tenant_id=tenant_id).count(), 2)
+    finally:
+      db.close()
+    listing = self.client.get(f"/tenants/{tenant_id}/archives").get_json()
+    self.assertEqual([(a["entity"], a["rows"]) for a in listing if a["entity"] == "messages"], [("messages", 2)] * 2)
+
+    hot = self._walk(f"/tenants/{tenant_id}/messages?x=1", limit=3)
+    self.assertEqual(len(hot), 4)
+    everything = self._walk(f"/tenants/{tenant_id}/messages?archived=1", limit=3)
+    # Seeded newest month first, two customers an hour apart within each month.
+    newest_first = [message_ids[i + 1 - j] for i in range(0, len(message_ids), 2) for j in range(2)]
+    self.assertEqual([m["id"] for m in everything], newest_first)
+    self.assertEqual([bool(m.get("archived")) for m in everything], [False] * 4 + [True] * 4)
+
+    one_customer = self._walk(f"/tenants/{tenant_id}/messages?archived=1&customer_id={customers[1]}", limit=2)
+    self.assertEqual([m["text"] for m in one_customer], ["0m-1", "1m-1", "4m-1", "5m-1"])
+
+    self.assertEqual(self._archive(3), [])
+
+  def test_archiving_resets_delta_sync_clients(self):
+    tenant_id = self._create_tenant("Synced Archive Shop")
+    self._seed(tenant_id, [0, 7])
+    cursor = self.client.get(f"/tenants/{tenant_id}/messages").headers["X-Sync-Cursor"]
+    unchanged = self.client.get(f"/tenants/{tenant_id}/messages?since={cursor}").get_json()
+    self.assertFalse(unchanged["full"])
+
+    self._archive(3)
+    body = self.client.get(f"/tenants/{tenant_id}/messages?since={cursor}").get_json()
+    self.assertTrue(body["full"])
+    self.assertEqual(len(body["items"]), 2)
+
+  def test_rows_without_a_premade_partition_land_in_default(self):
+    api = self.api
+    if api.engine.dialect.name != "postgresql":
+      self.skipTest("monthly partitions are PostgreSQL-only")
+    tenant_id = self._create_tenant("Far Future Shop")
+    far = api.month_start(datetime.utcnow(), api.PARTITION_PREMAKE_MONTHS + 6) + timedelta(days=2)
+    db = api.SessionLocal()
+    try:
+      db.add(api.Message(tenant_id=tenant_id, direction="in", text="from the future", created_at=far))
+      db.commit()
+    finally:
+      db.close()
+    created = api.ensure_month_partitions(now=far)
+    self.assertIn(api.month_partition_name("messages", api.month_start(far)), created)
+    db = api.SessionLocal()
+    try:
+      where = db.execute(
+        api.text("SELECT tableoid::regclass::text FROM messages WHERE tenant_id = :t"), {"t": tenant_id}
+      ).scalar()
+    finally:
+      db.close()
+    self.assertEqual(where, api.month_partition_name("messages", api.month_start(far)))
+
+  def test_stragglers_append_and_tenant_delete_removes_files(self):
+    api = self.api
+    tenant_id = self._create_tenant("Straggler Shop")
+    self._seed(tenant_id, [8])
+    self._archive(3)
+    self._seed(tenant_id, [8])
+    summary = self._archive(3)
+    self.assertEqual([s["rows"] for s in summary if s["entity"] == "messages"], [2])
+
+    db = api.SessionLocal()
+    try:
+      records = db.query(api.ArchivedMonth).filter_by(tenant_id=tenant_id, entity="messages").all()
+      self.assertEqual([r.row_count for r in records], [4])
+      self.assertEqual(len(api.read_archive(records[0])), 4)
+      paths = [r.path for r in db.query(api.ArchivedMonth).filter_by(tenant_id=tenant_id)]
+    finally:
+      db.close()
+    self.assertTrue(all(os.path.exists(p) for p in paths))
+
+    resp = self.client.delete(f"/tenants/{tenant_id}")
+    self.assertEqual(resp.status_code, 202, resp.get_data(as_text=True))
+    job_path = f"/tenants/{tenant_id}/purge-jobs/{resp.get_json()['job_id']}"
+    deadline = time.monotonic() + 10
+    while self.client.get(job_path).get_json()["status"] != "done" and time.monotonic() < deadline:
+      time.sleep(0.02)
+    self.assertFalse(any(os.path.exists(p) for p in paths))
+
+
+if __name__ == "__main__":
+  unittest.main()
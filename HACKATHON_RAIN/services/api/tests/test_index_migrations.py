@@ -0,0 +1,155 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+
+class IndexMigrationTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.pending_after_import = cls._recorded_versions()
+    cls.applied = cls.api.migrate_db()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  @classmethod
+  def _recorded_versions(cls) -> list:
+    db = cls.api.SessionLocal()
+    try:
+      return [v for (v,) in db.query(cls.api.SchemaMigration.version).order_by(cls.api.SchemaMigration.version)]
+    finally:
+      db.close()
+
+  def _hot_queries(self, db) -> list:
+    """
+    (label, query, index expected, table) for the per-message hot path.
+    """
+    api = self.api
+    return [
+      (
+        "customer lookup",
+        db.query(api.Customer).filter(api.Customer.tenant_id == 1, api.Customer.phone == "+2348000000000"),
+        "idx_customers_tenant_phone",
+        "customers",
+      ),
+      (
+        "conversation history",
+        db.query(api.Message)
+        .filter(api.Message.tenant_id == 1, api.Message.customer_id == 1)
+        .order_by(api.Message.created_at.asc())
+        .limit(20),
+        "idx_messages_tenant_customer_created",
+        "messages",
+      ),
+      (
+        "latest user session",
+        db.query(api.UserSession)
+        .filter(api.UserSession.customer_phone == "+2348000000000")
+        .order_by(api.UserSession.created_at.desc())
+        .limit(1),
+        "idx_user_sessions_phone_created",
+        "user_sessions",
+      ),
+      (
+        "customer state",
+        db.query(api.CustomerState).filter(
+          api.CustomerState.tenant_id == 1, api.CustomerState.customer_phone == "+2348000000000"
+        ),
+        "idx_customer_states_tenant_phone",
+        "customer_states",
+      ),
+      (
+        "trace page",
+        db.query(api.AgentTrace)
+        .filter(api.AgentTrace.tenant_id == 1)
+        .order_by(api.AgentTrace.created_at.desc(), api.AgentTrace.id.desc())
+        .limit(51),
+        "idx_agent_traces_tenant_created",
+        "agent_traces",
+      ),
+    ]
+
+  def _explain(self, db, query) -> str:
+    api = self.api
+    sql = str(query.statement.compile(dialect=api.engine.dialect, compile_kwargs={"literal_binds": True}))
+    if api.engine.dialect.name == "postgresql":
+      db.execute(api.text("SET LOCAL enable_seqscan = off"))
+      rows = db.execute(api.text("EXPLAIN " + sql)).all()
+      return "\n".join(row[0] for row in rows)
+    rows = db.execute(api.text("EXPLAIN QUERY PLAN " + sql)).all()
+    return "\n".join(str(row[-1]) for row in rows)
+
+  def test_hot_queries_use_their_indexes(self):
+    api = self.api
+    db = api.SessionLocal()
+    try:
+      for label, query, index_name, table in self._hot_queries(db):
+        plan = self._explain(db, query)
+        if api.engine.dialect.name == "postgresql" and table in api.PARTITIONED_TABLES:
+          # Partitions carry their own copies of the parent's indexes, under generated names.
+          self.assertRegex(plan, r"Index (Only )?Scan", f"{label}: {plan}")
+        else:
+          self.assertIn(index_name, plan, f"{label}: {plan}")
+        self.assertNotIn(f"Seq Scan on {table}", plan, f"{label}: {plan}")
+        self.assertNotRegex(plan, rf"\bSCAN {table}\b", f"{label}: {plan}")
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan, f"{label}: {plan}")
+    finally:
+      db.rollback()
+      db.close()
+
+  def _expected_versions(self, include_blocking: bool) -> list:
+    api = self.api
+    on_postgres = api.engine.dialect.name == "postgresql"
+    return [
+      version for version, name, _ in api.INDEX_MIGRATIONS
+      if include_blocking or not on_postgres or name not in api.BLOCKING_MIGRATIONS
+    ]
+
+  def test_migrations_are_recorded_once(self):
+    api = self.api
+    # Importing the module creates tables but runs no migrations.
+    self.assertEqual(self.pending_after_import, [])
+    self.assertEqual(self.applied, self._expected_versions(include_blocking=False))
+    self.assertEqual(self._recorded_versions(), self._expected_versions(include_blocking=False))
+    self.assertEqual(api.migrate_db(), [])
+
+  def test_table_rewrites_wait_for_an_explicit_opt_in(self):
+    api = self.api
+    names = {name for _, name, _ in api.INDEX_MIGRATIONS}
+    self.assertIn("monthly_partitions", api.BLOCKING_MIGRATIONS)
+    self.assertTrue(api.BLOCKING_MIGRATIONS <= names)
+    if api.engine.dialect.name != "postgresql":
+      self.skipTest("table rewrites only happen on PostgreSQL")
+    with api.engine.connect() as conn:
+      self.assertFalse(api._is_partitioned(conn, "messages"))
+
+  def test_postgres_builds_concurrently(self):
+    sql = self.api.index_migration_sql("postgresql", "idx_customers_tenant_phone", "customers", ("tenant_id", "phone"))
+    self.assertEqual(
+      sql, "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_customers_tenant_phone ON customers(tenant_id, phone)"
+    )
+    self.assertNotIn("CONCURRENTLY", self.api.index_migration_sql("sqlite", "i", "t", ("a",)))
+
+
+if __name__ == "__main__":
+  unittest.main()
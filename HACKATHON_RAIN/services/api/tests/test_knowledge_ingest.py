@@ -0,0 +1,469 @@
+import importlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+
+class KnowledgeIngestTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _upload(self, tenant_id: int, filename: str, data: bytes):
+    return self.client.post(
+      f"/tenants/{tenant_id}/knowledge/upload",
+      data={"file": (io.BytesIO(data), filename), "append": "1"},
+      content_type="multipart/form-data",
+    )
+
+  def _wait_for_job(self, tenant_id: int, job_id: int) -> dict:
+    deadline = time.time() + 10
+    while time.time() < deadline:
+      resp = self.client.get(f"/tenants/{tenant_id}/knowledge/jobs/{job_id}")
+      self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+      body = resp.get_json()
+      if body["status"] in {"done", "failed"}:
+        return body
+      time.sleep(0.05)
+    self.fail("ingest job did not finish")
+
+  def test_upload_is_ingested_in_background(self):
+    tenant_id = self._create_tenant("Ingest Shop")
+
+    resp = self._upload(tenant_id, "menu.txt", b"Jollof rice is 2500 naira.\nPepper soup is 3000 naira.")
+    self.assertEqual(resp.status_code, 202, resp.get_data(as_text=True))
+    job_id = int(resp.get_json()["job_id"])
+
+    job = self._wait_for_job(tenant_id, job_id)
+    self.assertEqual(job["status"], "done", job)
+    self.assertGreater(job["chars"], 0)
+
+    knowledge = self.client.get(f"/tenants/{tenant_id}/knowledge").get_json()
+    self.assertEqual(knowledge["total_documents"], 1)
+    doc = knowledge["documents"][0]
+    self.assertEqual(doc["id"], job["document_id"])
+    self.assertEqual(doc["source_name"], "menu.txt")
+    self.assertGreater(doc["chunk_count"], 0)
+    self.assertEqual(len(doc["content_hash"]), 64)
+
+    full = self.client.get(f"/tenants/{tenant_id}/knowledge/documents/{doc['id']}").get_json()
+    self.assertIn("Jollof rice", full["raw_text"])
+
+  def test_reupload_with_small_edit_collapses_near_duplicates(self):
+    tenant_id = self._create_tenant("Dedupe Shop")
+    menu = "\n".join(
+      f"Item {i}: grilled chicken platter number {i} served with jollof rice, plantain and coleslaw for {1000 + i * 50} naira."
+      for i in range(30)
+    ).encode("utf-8")
+    edited = menu.replace(b"Item 29:", b"Item 29 (new):")
+
+    first = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "menu.txt", menu).get_json()["job_id"]))
+    self.assertEqual(first["dedupe"]["duplicates_collapsed"], 0, first)
+
+    second = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "menu_v2.txt", edited).get_json()["job_id"]))
+    report = second["dedupe"]
+    self.assertGreater(report["duplicates_collapsed"], 0, report)
+
+    db = self.api.SessionLocal()
+    try:
+      # The older document's copies were superseded by the newer upload.
+      first_chunks = db.query(self.api.KnowledgeChunk).filter_by(document_id=first["document_id"]).count()
+      self.assertLess(first_chunks, first["dedupe"]["chunks_indexed"])
+      results = self.api.retrieve_knowledge_chunks(db, tenant_id, "grilled chicken platter", limit=4)
+    finally:
+      db.close()
+    shingles = [self.api.chunk_shingles(r["content"]) for r in results]
+    for i in range(len(shingles)):
+      for j in range(i + 1, len(shingles)):
+        jaccard = len(shingles[i] & shingles[j]) / len(shingles[i] | shingles[j])
+        self.assertLess(jaccard, self.api.KNOWLEDGE_DEDUPE_THRESHOLD)
+
+  def test_deleting_the_newer_copy_restores_the_older_document(self):
+    tenant_id = self._create_tenant("Restore Shop")
+    menu = "\n".join(
+      f"Item {i}: pepper soup bowl number {i} served with boiled yam and agidi for {2000 + i * 75} naira."
+      for i in range(30)
+    ).encode("utf-8")
+    first = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "a.txt", menu).get_json()["job_id"]))
+    edited = menu.replace(b"Item 29:", b"Item 29 (new):")
+    second = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "b.txt", edited).get_json()["job_id"]))
+    self.assertGreater(second["dedupe"]["duplicates_collapsed"], 0, second)
+
+    resp = self.client.delete(f"/tenants/{tenant_id}/knowledge/documents/{second['document_id']}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    doc = self.client.get(f"/tenants/{tenant_id}/knowledge/documents/{first['document_id']}").get_json()
+    self.assertEqual(doc["chunk_count"], first["dedupe"]["chunks_indexed"])
+
+    db = self.api.SessionLocal()
+    try:
+      results = self.api.retrieve_knowledge_chunks(db, tenant_id, "pepper soup bowl number 3 agidi", limit=4)
+    finally:
+      db.close()
+    self.assertTrue(results)
+    self.assertTrue(all(r.get("document_id", first["document_id"]) == first["document_id"] for r in results), results)
+    self.assertTrue(any("Item 3:" in r["content"] for r in results), results)
+
+  def test_deleting_an_unrelated_document_leaves_self_deduped_documents_alone(self):
+    tenant_id = self._create_tenant("Self Dedupe Shop")
+    block = "Opening hours: Monday to Saturday from nine in the morning until seven in the evening, closed Sundays. " * 12
+    repeated = "\n".join([block] * 6).encode("utf-8")
+    first = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "hours.txt", repeated).get_json()["job_id"]))
+    self.assertGreater(first["dedupe"]["duplicates_collapsed"], 0, first)
+    other = b"Parking is free behind the shop and there is a ramp at the side entrance for wheelchairs."
+    second = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "parking.txt", other).get_json()["job_id"]))
+
+    db = self.api.SessionLocal()
+    try:
+      before = sorted(cid for (cid,) in db.query(self.api.KnowledgeChunk.id).filter_by(document_id=first["document_id"]))
+      self.assertEqual(db.get(self.api.KnowledgeDocument, first["document_id"]).superseded_chunks, 0)
+    finally:
+      db.close()
+
+    resp = self.client.delete(f"/tenants/{tenant_id}/knowledge/documents/{second['document_id']}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    db = self.api.SessionLocal()
+    try:
+      after = sorted(cid for (cid,) in db.query(self.api.KnowledgeChunk.id).filter_by(document_id=first["document_id"]))
+    finally:
+      db.close()
+    # Not re-indexed: the chunks it dropped were duplicates of itself.
+    self.assertEqual(after, before)
+
+  def test_near_duplicate_candidates_come_from_the_band_index(self):
+    api = self.api
+    tenant_id = self._create_tenant("Band Shop")
+    menu = "\n".join(
+      f"Item {i}: suya skewer plate number {i} served with onions, pepper and yaji for {1500 + i * 40} naira."
+      for i in range(30)
+    )
+    unrelated = "Delivery runs daily across Lekki and Ajah; orders above 10000 naira ship free within two hours."
+    first = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "suya.txt", menu.encode("utf-8")).get_json()["job_id"]))
+
+    db = api.SessionLocal()
+    try:
+      chunk_ids = {cid for (cid,) in db.query(api.KnowledgeChunk.id).filter_by(document_id=first["document_id"])}
+      self.assertEqual(
+        db.query(api.KnowledgeChunkBand).filter(api.KnowledgeChunkBand.chunk_id.in_(chunk_ids)).count(),
+        len(chunk_ids) * api._MINHASH_BANDS,
+      )
+
+      def candidates(text):
+        keys = {k for c in api.chunk_text(text) for k in api.minhash_band_keys(api.minhash_signature(c))}
+        return {row[0] for row in api.knowledge_band_candidates(db, tenant_id, keys)}
+
+      self.assertEqual(candidates(unrelated), set())
+      self.assertTrue(candidates(menu.replace("Item 29:", "Item 29 (new):")) & chunk_ids)
+
+      # Legacy chunks without band rows get them from the migration.
+      db.query(api.KnowledgeChunkBand).filter(api.KnowledgeChunkBand.chunk_id.in_(chunk_ids)).delete(synchronize_session=False)
+      db.commit()
+      with api.engine.begin() as conn:
+        api._backfill_knowledge_chunk_bands(conn, api.engine.dialect.name)
+      self.assertTrue(candidates(menu) >= chunk_ids)
+    finally:
+      db.close()
+
+    resp = self.client.delete(f"/tenants/{tenant_id}/knowledge/documents/{first['document_id']}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    db = api.SessionLocal()
+    try:
+      self.assertEqual(db.query(api.KnowledgeChunkBand).filter(api.KnowledgeChunkBand.chunk_id.in_(chunk_ids)).count(), 0)
+    finally:
+      db.close()
+
+  def test_documents_are_paged_deleted_and_deduped_by_hash(self):
+    tenant_id = self._create_tenant("Docs Shop")
+    put = self.client.put(f"/tenants/{tenant_id}/knowledge", json={"raw_text": "We open at 9am daily."})
+    self.assertEqual(put.status_code, 200, put.get_data(as_text=True))
+
+    jobs = [
+      self._wait_for_job(tenant_id, int(self._upload(tenant_id, f"doc{i}.txt", f"Policy {i}: refunds within {i} days.".encode()).get_json()["job_id"]))
+      for i in range(3)
+    ]
+    again = self._wait_for_job(tenant_id, int(self._upload(tenant_id, "copy.txt", b"Policy 1: refunds within 1 days.").get_json()["job_id"]))
+    self.assertEqual(again["document_id"], jobs[1]["document_id"])
+    self.assertEqual(again["dedupe"]["duplicate_of"], jobs[1]["document_id"])
+
+    page = self.client.get(f"/tenants/{tenant_id}/knowledge?limit=2").get_json()
+    self.assertEqual(page["raw_text"], "We open at 9am daily.")
+    self.assertEqual(page["total_documents"], 4)
+    self.assertEqual(len(page["documents"]), 2)
+    rest = self.client.get(f"/tenants/{tenant_id}/knowledge?limit=2&before_id={page['next_before_id']}").get_json()
+    self.assertIsNone(rest["next_before_id"])
+    seen = [d["id"] for d in page["documents"] + rest["documents"]]
+    self.assertEqual(len(set(seen)), 4)
+
+    target = jobs[0]["document_id"]
+    resp = self.client.delete(f"/tenants/{tenant_id}/knowledge/documents/{target}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    db = self.api.SessionLocal()
+    try:
+      self.assertEqual(db.query(self.api.KnowledgeChunk).filter_by(document_id=target).count(), 0)
+      self.assertGreater(db.query(self.api.KnowledgeChunk).filter_by(tenant_id=tenant_id).count(), 0)
+    finally:
+      db.close()
+
+  def test_legacy_knowledge_blob_is_split_into_documents(self):
+    tenant_id = self._create_tenant("Legacy Shop")
+    db = self.api.SessionLocal()
+    try:
+      db.add(self.api.TenantKnowledge(
+        tenant_id=tenant_id,
+        raw_text="Closed on Sundays.\n\n---\nSOURCE: menu.pdf\n---\nSuya is 1500 naira.",
+      ))
+      db.commit()
+    finally:
+      db.close()
+
+    knowledge = self.client.get(f"/tenants/{tenant_id}/knowledge").get_json()
+    self.assertEqual(knowledge["raw_text"], "Closed on Sundays.")
+    names = {d["source_name"]: d["kind"] for d in knowledge["documents"]}
+    self.assertEqual(names, {"menu.pdf": "upload", "Manual notes": "manual"})
+
+  def test_repeat_retrieval_is_cached_until_knowledge_changes(self):
+    tenant_id = self._create_tenant("Cache Shop")
+    self.client.put(f"/tenants/{tenant_id}/knowledge", json={"raw_text": "Delivery costs 500 naira within Lekki."})
+
+    db = self.api.SessionLocal()
+    try:
+      first = self.api.retrieve_knowledge_chunks(db, tenant_id, "Delivery costs?", limit=4)
+      second = self.api.retrieve_knowledge_chunks(db, tenant_id, "delivery COSTS", limit=4)
+    finally:
+      db.close()
+    self.assertEqual(first, second)
+    stats = self.client.get(f"/tenants/{tenant_id}/knowledge/cache").get_json()
+    self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    self.client.put(f"/tenants/{tenant_id}/knowledge", json={"raw_text": "Delivery costs 800 naira within Lekki."})
+    db = self.api.SessionLocal()
+    try:
+      third = self.api.retrieve_knowledge_chunks(db, tenant_id, "delivery costs", limit=4)
+    finally:
+      db.close()
+    self.assertIn("800", third[0]["content"])
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/knowledge/cache").get_json()["misses"], 2)
+
+  def test_retrieval_cache_is_bounded_across_tenants(self):
+    cache = self.api.RetrievalCache(max_entries=3, max_total=4)
+    for tenant_id in (1, 2):
+      for q in ("a", "b", "c"):
+        cache.put(tenant_id, 1, (q, 4), [{"q": q}])
+    # Tenant 1's two least recently used entries made room for tenant 2's.
+    self.assertEqual(cache.stats(1)["entries"], 1)
+    self.assertEqual(cache.stats(2)["entries"], 3)
+    self.assertEqual(cache.stats(1)["total_entries"], 4)
+    self.assertIsNone(cache.get(1, 1, ("a", 4)))
+    self.assertEqual(cache.get(1, 1, ("c", 4)), [{"q": "c"}])
+
+    # A hit counts as use: tenant 2's oldest entry goes next.
+    cache.put(3, 1, ("a", 4), [{"q": "a"}])
+    self.assertIsNone(cache.get(2, 1, ("a", 4)))
+    self.assertEqual(cache.get(1, 1, ("c", 4)), [{"q": "c"}])
+
+    # A new knowledge version frees the tenant's share of the global bound.
+    cache.get(2, 2, ("b", 4))
+    self.assertEqual(cache.stats(2)["total_entries"], 2)
+    cache.clear(3)
+    self.assertEqual(cache.stats(1)["total_entries"], 1)
+
+  def test_oversized_upload_is_rejected_while_streaming(self):
+    tenant_id = self._create_tenant("Big Upload Shop")
+    original = self.api.KNOWLEDGE_UPLOAD_MAX_BYTES
+    self.api.KNOWLEDGE_UPLOAD_MAX_BYTES = 1024
+    try:
+      resp = self._upload(tenant_id, "huge.txt", b"x" * (256 * 1024))
+    finally:
+      self.api.KNOWLEDGE_UPLOAD_MAX_BYTES = original
+    self.assertEqual(resp.status_code, 413, resp.get_data(as_text=True))
+
+  def _chunked_upload(self, tenant_id: int, data: bytes):
+    """
+    Multipart upload sent the way a chunked client sends it: no
+    Content-Length, the body ends where the stream ends.
+    """
+    boundary = "agentdockboundary"
+    body = (
+      f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"notes.txt\"\r\n"
+      f"Content-Type: text/plain\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return self.client.post(
+      f"/tenants/{tenant_id}/knowledge/upload",
+      input_stream=io.BytesIO(body),
+      content_type=f"multipart/form-data; boundary={boundary}",
+      headers={"Transfer-Encoding": "chunked"},
+      environ_overrides={"wsgi.input_terminated": True},
+    )
+
+  def test_chunked_upload_without_content_length_is_capped(self):
+    tenant_id = self._create_tenant("Chunked Shop")
+    ok = self._chunked_upload(tenant_id, b"Chin chin is 800 naira per pack.")
+    self.assertEqual(ok.status_code, 202, ok.get_data(as_text=True))
+    self.assertEqual(self._wait_for_job(tenant_id, int(ok.get_json()["job_id"]))["status"], "done")
+
+    app = self.api.app
+    original = app.config["MAX_CONTENT_LENGTH"]
+    app.config["MAX_CONTENT_LENGTH"] = 4096
+    try:
+      resp = self._chunked_upload(tenant_id, b"x" * (256 * 1024))
+    finally:
+      app.config["MAX_CONTENT_LENGTH"] = original
+    self.assertEqual(resp.status_code, 413, resp.get_data(as_text=True))
+    self.assertIn("too large", resp.get_json()["error"])
+
+  def _write_pdf(self, path: str, pages: int) -> None:
+    """
+    Minimal PDF with one line of text per page.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for n in range(pages):
+      stream = f"BT /F1 18 Tf 72 720 Td (Page {n + 1} says hello) Tj ET"
+      objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+      objects.append(
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+        "/Resources << /Font << /F1 3 0 R >> >> >>"
+      )
+      kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+      offsets.append(len(out))
+      out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as fh:
+      fh.write(out)
+
+  def test_large_pdf_is_extracted_in_parallel_and_in_order(self):
+    api = self.api
+    path = os.path.join(self._tmpdir.name, "brochure.pdf")
+    self._write_pdf(path, 7)
+    saved = (api.KNOWLEDGE_PDF_PROCESSES, api.KNOWLEDGE_PDF_PAGES_PER_TASK)
+    api.KNOWLEDGE_PDF_PROCESSES, api.KNOWLEDGE_PDF_PAGES_PER_TASK = 2, 2
+    progress = []
+    try:
+      text = api.extract_text_from_path(path, "brochure.pdf", on_progress=lambda done, total: progress.append((done, total)))
+      pool = api._get_pdf_pool()
+    finally:
+      api.KNOWLEDGE_PDF_PROCESSES, api.KNOWLEDGE_PDF_PAGES_PER_TASK = saved
+    self.assertEqual(
+      [line for line in text.split("\n\n")], [f"Page {n} says hello" for n in range(1, 8)]
+    )
+    self.assertEqual(progress[0], (0, 7))
+    self.assertEqual(progress[-1], (7, 7))
+    self.assertEqual(len(progress), 5)
+    self.assertEqual(pool._mp_context.get_start_method(), "spawn")
+
+  def test_unsupported_extension_is_rejected_up_front(self):
+    tenant_id = self._create_tenant("Bad Ext Shop")
+    resp = self._upload(tenant_id, "menu.xlsx", b"data")
+    self.assertEqual(resp.status_code, 400, resp.get_data(as_text=True))
+
+  def _stored_job(self, tenant_id: int, data, status: str, lease_until=None) -> int:
+    api = self.api
+    path = None
+    if data is not None:
+      os.makedirs(api.KNOWLEDGE_UPLOAD_DIR, exist_ok=True)
+      path = os.path.join(api.KNOWLEDGE_UPLOAD_DIR, f"t{tenant_id}_resume_{status}_{time.time_ns()}.txt")
+      with open(path, "wb") as f:
+        f.write(data)
+    db = api.SessionLocal()
+    try:
+      job = api.KnowledgeIngestJob(
+        tenant_id=tenant_id, filename="resumed.txt", file_path=path or "/nonexistent/upload.txt",
+        append=True, status=status, lease_until=lease_until,
+      )
+      db.add(job)
+      db.commit()
+      return job.id
+    finally:
+      db.close()
+
+  def test_unfinished_jobs_resume_at_startup(self):
+    api = self.api
+    tenant_id = self._create_tenant("Restarted Shop")
+    expired = api.datetime.utcnow() - api.timedelta(seconds=1)
+    live = api.datetime.utcnow() + api.timedelta(minutes=5)
+    crashed = self._stored_job(tenant_id, b"Suya is 1500 naira per stick.", "extracting", lease_until=expired)
+    queued = self._stored_job(tenant_id, b"Zobo is 500 naira per bottle.", "queued")
+    running = self._stored_job(tenant_id, b"Chapman is 900 naira.", "indexing", lease_until=live)
+    missing = self._stored_job(tenant_id, None, "queued")
+
+    self.assertEqual(api.resume_knowledge_ingest_jobs(), 3)
+    self.assertEqual(self._wait_for_job(tenant_id, crashed)["status"], "done")
+    self.assertEqual(self._wait_for_job(tenant_id, queued)["status"], "done")
+    failed = self._wait_for_job(tenant_id, missing)
+    self.assertEqual(failed["status"], "failed")
+    self.assertIn("upload it again", failed["error"])
+    # A job another worker still holds is left alone.
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/knowledge/jobs/{running}").get_json()["status"], "indexing")
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/knowledge").get_json()["total_documents"], 2)
+
+  def test_jobs_for_one_tenant_index_one_at_a_time(self):
+    api = self.api
+    tenant_id = self._create_tenant("Busy Ingest Shop")
+    original = api.apply_knowledge_upload
+    active = {"now": 0, "max": 0}
+    guard = threading.Lock()
+
+    def slow_apply(*args, **kwargs):
+      with guard:
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+      try:
+        time.sleep(0.2)
+        return original(*args, **kwargs)
+      finally:
+        with guard:
+          active["now"] -= 1
+
+    menu = "\n".join(f"Dish {i}: ofada rice tray {i} with ayamase sauce for {3000 + i * 50} naira." for i in range(20))
+    api.apply_knowledge_upload = slow_apply
+    try:
+      jobs = [
+        int(self._upload(tenant_id, f"menu{i}.txt", (menu + f"\nExtra {i}.").encode()).get_json()["job_id"])
+        for i in range(2)
+      ]
+      results = [self._wait_for_job(tenant_id, job_id) for job_id in jobs]
+    finally:
+      api.apply_knowledge_upload = original
+    self.assertEqual(active["max"], 1)
+    self.assertEqual([r["status"] for r in results], ["done", "done"])
+    self.assertEqual(sum(r["dedupe"]["duplicates_collapsed"] > 0 for r in results), 1, results)
+
+
+if __name__ == "__main__":
+  unittest.main()
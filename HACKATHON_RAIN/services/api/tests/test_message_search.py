@@ -0,0 +1,131 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class MessageSearchTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.api.migrate_db()
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "salon"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed(self, tenant_id: int) -> dict:
+    api = self.api
+    now = datetime.utcnow()
+    db = api.SessionLocal()
+    try:
+      ada = api.Customer(tenant_id=tenant_id, phone="+2348011111111", name="Ada")
+      bola = api.Customer(tenant_id=tenant_id, phone="+2348022222222", name="Bola")
+      db.add_all([ada, bola])
+      db.flush()
+      rows = [
+        (ada, "in", "How much are knotless braids? braids braids", now - timedelta(days=30)),
+        (ada, "out", "Knotless braids are 15000 naira", now - timedelta(days=30)),
+        (bola, "in", "Do you do <b>braiding</b> for kids?", now - timedelta(days=2)),
+        (bola, "in", "Can I book a haircut tomorrow?", now - timedelta(days=1)),
+      ]
+      messages = [
+        api.Message(tenant_id=tenant_id, customer_id=c.id, direction=d, text=t, created_at=at) for c, d, t, at in rows
+      ]
+      db.add_all(messages)
+      db.commit()
+      return {"ada": ada.id, "bola": bola.id, "ids": [m.id for m in messages]}
+    finally:
+      db.close()
+
+  def _search(self, tenant_id: int, query: str, status: int = 200):
+    resp = self.client.get(f"/tenants/{tenant_id}/messages/search?{query}")
+    self.assertEqual(resp.status_code, status, resp.get_data(as_text=True))
+    return resp
+
+  def test_ranked_highlighted_results(self):
+    tenant_id = self._create_tenant("Search Salon")
+    seeded = self._seed(tenant_id)
+    other = self._create_tenant("Other Salon")
+    self._seed(other)
+
+    items = self._search(tenant_id, "q=braid").get_json()
+    self.assertEqual([item["id"] for item in items], seeded["ids"][:3])
+    self.assertGreater(items[0]["score"], items[1]["score"])
+    self.assertEqual(items[0]["customer_name"], "Ada")
+    self.assertIn("<mark>braids</mark>", items[0]["highlight"])
+    self.assertIn("&lt;b&gt;<mark>braiding</mark>&lt;/b&gt;", items[2]["highlight"])
+
+    both = self._search(tenant_id, "q=knotless+BRAIDS").get_json()
+    self.assertEqual(sorted(item["id"] for item in both), seeded["ids"][:2])
+
+  def test_filters(self):
+    tenant_id = self._create_tenant("Filter Salon")
+    seeded = self._seed(tenant_id)
+    ids = lambda query: [item["id"] for item in self._search(tenant_id, query).get_json()]
+
+    self.assertEqual(ids(f"q=braid&customer_id={seeded['bola']}"), [seeded["ids"][2]])
+    self.assertEqual(ids("q=braids&direction=out"), [seeded["ids"][1]])
+    since = (datetime.utcnow() - timedelta(days=7)).isoformat()
+    self.assertEqual(ids(f"q=braid&from={since}"), [seeded["ids"][2]])
+    until = (datetime.utcnow() - timedelta(days=7)).isoformat()
+    self.assertEqual(sorted(ids(f"q=braids&to={until}")), seeded["ids"][:2])
+
+    self._search(tenant_id, "q=%20%22*", status=400)
+    self._search(tenant_id, "q=braids&direction=sideways", status=400)
+    self._search(tenant_id, "q=braids&from=yesterday", status=400)
+    self._search(tenant_id, "q=braids&cursor=nope", status=400)
+    self._search(999999, "q=braids", status=404)
+
+  def test_pages_and_follows_writes(self):
+    tenant_id = self._create_tenant("Paged Salon")
+    seeded = self._seed(tenant_id)
+    resp = self._search(tenant_id, "q=braid&limit=2")
+    seen = [item["id"] for item in resp.get_json()]
+    cursor = resp.headers.get("X-Next-Cursor")
+    self.assertIsNotNone(cursor)
+    rest = self._search(tenant_id, f"q=braid&limit=2&cursor={cursor}")
+    self.assertIsNone(rest.headers.get("X-Next-Cursor"))
+    seen += [item["id"] for item in rest.get_json()]
+    self.assertEqual(seen, seeded["ids"][:3])
+
+    api = self.api
+    db = api.SessionLocal()
+    try:
+      db.get(api.Message, seeded["ids"][3]).text = "Actually I want cornrow braids"
+      db.delete(db.get(api.Message, seeded["ids"][0]))
+      db.commit()
+    finally:
+      db.close()
+    found = [item["id"] for item in self._search(tenant_id, "q=braids").get_json()]
+    self.assertNotIn(seeded["ids"][0], found)
+    self.assertIn(seeded["ids"][3], found)
+    self.assertEqual(self._search(tenant_id, "q=haircut").get_json(), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
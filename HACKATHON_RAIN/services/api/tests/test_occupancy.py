@@ -0,0 +1,128 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+
+class OccupancyTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str, profile: dict) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    tenant_id = int(resp.get_json()["id"])
+    db = self.api.SessionLocal()
+    try:
+      db.get(self.api.Tenant, tenant_id).business_profile = profile
+      db.commit()
+    finally:
+      db.close()
+    return tenant_id
+
+  def _next_monday(self) -> datetime:
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=7 - today.weekday())
+
+  def _book(self, tenant_id: int, start: datetime) -> int:
+    resp = self.client.post(f"/tenants/{tenant_id}/appointments", json={"start_time": start.isoformat()})
+    self.assertIn(resp.status_code, (200, 201), resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def test_heatmap_and_empty_slots(self):
+    monday = self._next_monday()
+    tenant_id = self._create_tenant(
+      "Slots Shop", {"opening_hours": {"monday": "09:00-12:00", "tuesday": "9-10", "sunday": "closed"}}
+    )
+    self._book(tenant_id, monday.replace(hour=9))
+    self._book(tenant_id, monday.replace(hour=10, minute=40))
+    self._book(tenant_id, monday.replace(hour=10, minute=40) + timedelta(days=7))
+
+    body = self.client.get(f"/tenants/{tenant_id}/occupancy").get_json()
+    self.assertEqual(body["slot_minutes"], 30)
+    self.assertEqual(len(body["counts"]), 7)
+    self.assertEqual(len(body["slots"]), 48)
+    self.assertEqual(body["counts"][0][18], 1)
+    self.assertEqual(body["counts"][0][21], 2)
+    self.assertEqual(body["bookings"], 3)
+    self.assertEqual(body["weeks_observed"], 2)
+    self.assertEqual(body["utilisation"][0][21], 1.0)
+    self.assertEqual(body["busiest_slot"], {"weekday": "monday", "start": "10:30", "bookings": 2})
+    self.assertEqual(
+      body["empty_slots"],
+      [
+        {"weekday": "monday", "start": "09:30", "end": "10:30", "minutes": 60},
+        {"weekday": "monday", "start": "11:00", "end": "12:00", "minutes": 60},
+        {"weekday": "tuesday", "start": "09:00", "end": "10:00", "minutes": 60},
+      ],
+    )
+
+    suggestions = self.client.get(f"/tenants/{tenant_id}/optimization-suggestions").get_json()["suggestions"]
+    titles = [s["title"] for s in suggestions if s["type"] == "pricing"]
+    self.assertEqual(
+      titles,
+      ["Consider promotional pricing for Monday 09:30-10:30", "Consider promotional pricing for Tuesday 09:00-10:00"],
+    )
+
+  def test_create_and_cancel_update_matrix_incrementally(self):
+    monday = self._next_monday()
+    tenant_id = self._create_tenant("Live Slots Shop", {"opening_hours": {"monday": "09:00-11:00"}})
+    self._book(tenant_id, monday.replace(hour=9))
+    engine = self.api._OCCUPANCY_ENGINE
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/occupancy").status_code, 200)
+    full, incremental = engine.full_refreshes, engine.incremental_refreshes
+
+    appointment_id = self._book(tenant_id, monday.replace(hour=10))
+    body = self.client.get(f"/tenants/{tenant_id}/occupancy").get_json()
+    self.assertEqual(body["counts"][0][20], 1)
+    self.assertEqual(
+      [(run["start"], run["end"]) for run in body["empty_slots"]], [("09:30", "10:00"), ("10:30", "11:00")]
+    )
+
+    resp = self.client.patch(f"/appointments/{appointment_id}", json={"status": "cancelled"})
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    body = self.client.get(f"/tenants/{tenant_id}/occupancy").get_json()
+    self.assertEqual(body["counts"][0][20], 0)
+    self.assertEqual(body["bookings"], 1)
+    self.assertEqual((engine.full_refreshes, engine.incremental_refreshes), (full, incremental + 2))
+
+  def test_local_time_and_opening_hours_parsing(self):
+    api = self.api
+    lagos = api.tenant_zone_from_profile({"time_zone": "UTC+1"})
+    engine = api.OccupancyEngine(slot_minutes=60)
+    aware = datetime(2024, 1, 1, 23, 30, tzinfo=timezone.utc)  # Monday 23:30 UTC is Tuesday 00:30 in UTC+1
+    self.assertEqual(engine._cell(aware, lagos), 1 * 24 + 0)
+    self.assertEqual(engine._cell(aware.replace(tzinfo=None), lagos), 0 * 24 + 23)
+
+    mask = api.opening_hours_slot_mask({"monday": "08:30-10:00, 14-15", "friday": "nonsense", "saturday": "22:00-02:00"}, 60)
+    self.assertEqual([slot for slot, is_open in enumerate(mask[0]) if is_open], [9, 14])
+    self.assertFalse(any(mask[4]))
+    self.assertEqual([slot for slot, is_open in enumerate(mask[5]) if is_open], [22, 23])
+
+
+if __name__ == "__main__":
+  unittest.main()
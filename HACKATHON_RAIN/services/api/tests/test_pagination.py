@@ -0,0 +1,120 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class KeysetPaginationTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed(self, tenant_id: int) -> None:
+    api = self.api
+    same_instant = datetime.utcnow() - timedelta(hours=1)
+    db = api.SessionLocal()
+    try:
+      # Equal created_at values exercise the id tie-breaker.
+      db.add_all([api.Message(tenant_id=tenant_id, direction="in", text=f"m{i}", created_at=same_instant) for i in range(5)])
+      db.add_all(
+        [api.Order(tenant_id=tenant_id, status="pending", created_at=same_instant + timedelta(minutes=i)) for i in range(5)]
+      )
+      db.add_all([api.Complaint(tenant_id=tenant_id, complaint_details=f"c{i}") for i in range(5)])
+      db.add_all([api.Handoff(tenant_id=tenant_id, reason=f"h{i}") for i in range(5)])
+      db.add_all([api.AgentTrace(tenant_id=tenant_id, model_used=f"t{i}") for i in range(5)])
+      slot = same_instant.replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+      db.add_all([api.Appointment(tenant_id=tenant_id, start_time=slot + timedelta(hours=i)) for i in range(5)])
+      db.commit()
+    finally:
+      db.close()
+
+  def _walk(self, path: str, limit: int = 2) -> list:
+    sep = "&" if "?" in path else "?"
+    resp = self.client.get(f"{path}{sep}limit={limit}")
+    self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+    pages = [resp.get_json()]
+    while resp.headers.get("X-Next-Cursor"):
+      resp = self.client.get(f"{path}{sep}limit={limit}&cursor={resp.headers['X-Next-Cursor']}")
+      self.assertEqual(resp.status_code, 200, resp.get_data(as_text=True))
+      pages.append(resp.get_json())
+    self.assertTrue(all(0 < len(p) <= limit for p in pages), [len(p) for p in pages])
+    return [item for page in pages for item in page]
+
+  def test_every_list_endpoint_pages_newest_first_without_gaps(self):
+    tenant_id = self._create_tenant("Paged Shop")
+    self._seed(tenant_id)
+    for entity in ("messages", "orders", "complaints", "handoffs", "trace", "appointments"):
+      items = self._walk(f"/tenants/{tenant_id}/{entity}")
+      self.assertEqual(len(items), 5, entity)
+      ids = [item["id"] for item in items]
+      self.assertEqual(len(set(ids)), 5, entity)
+      if entity != "appointments":
+        keys = [(item["created_at"], item["id"]) for item in items]
+        self.assertEqual(keys, sorted(keys, reverse=True), entity)
+
+    messages = self._walk(f"/tenants/{tenant_id}/messages")
+    self.assertEqual([m["text"] for m in messages], [f"m{i}" for i in reversed(range(5))])
+
+  def test_tenants_page_oldest_first(self):
+    created = [self._create_tenant(f"Switcher {i}") for i in range(3)]
+    ids = [t["id"] for t in self._walk("/tenants", limit=1)]
+    self.assertEqual(ids, sorted(ids))
+    self.assertTrue(set(created) <= set(ids))
+
+  def test_limits_and_bad_cursors(self):
+    tenant_id = self._create_tenant("Limits Shop")
+    self._seed(tenant_id)
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/orders?limit=abc").status_code, 400)
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/orders?cursor=nope").status_code, 400)
+    self.assertEqual(len(self.client.get(f"/tenants/{tenant_id}/orders?limit=0").get_json()), 1)
+
+    original = self.api.LIST_PAGE_MAX
+    self.api.LIST_PAGE_MAX = 3
+    try:
+      resp = self.client.get(f"/tenants/{tenant_id}/orders?limit=1000")
+    finally:
+      self.api.LIST_PAGE_MAX = original
+    self.assertEqual(len(resp.get_json()), 3)
+    self.assertIsNotNone(resp.headers.get("X-Next-Cursor"))
+
+  def test_full_sync_snapshot_reports_next_cursor(self):
+    tenant_id = self._create_tenant("Sync Page Shop")
+    self._seed(tenant_id)
+    future = self.api.encode_sync_cursor(10 ** 6)
+    body = self.client.get(f"/tenants/{tenant_id}/orders?since={future}&limit=2").get_json()
+    self.assertTrue(body["full"])
+    self.assertEqual(len(body["items"]), 2)
+    rest = self.client.get(f"/tenants/{tenant_id}/orders?limit=10&cursor={body['next_cursor']}").get_json()
+    self.assertEqual(len(rest), 3)
+
+
+if __name__ == "__main__":
+  unittest.main()
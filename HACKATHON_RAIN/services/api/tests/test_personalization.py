@@ -0,0 +1,107 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class PersonalizationTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def test_profiles_are_one_query_and_keyset_paged(self):
+    api = self.api
+    tenant_id = self._create_tenant("Personal Shop")
+    db = api.SessionLocal()
+    try:
+      # Two "Dye" rows (re-created service) count as one preference.
+      services = [api.Service(tenant_id=tenant_id, name=n) for n in ("Cut", "Dye", "Shave", "Braids", "Dye")]
+      customers = [api.Customer(tenant_id=tenant_id, name=f"C{i}", phone=f"+23482000000{i}") for i in range(3)]
+      db.add_all(services + customers)
+      db.flush()
+      start = datetime.utcnow() + timedelta(days=1)
+      plan = {0: [0, 0, 0, 1, 4, 2, 3], 1: [1, 4, None, None, None], 2: []}
+      n = 0
+      for ci, service_idx in plan.items():
+        for si in service_idx:
+          n += 1
+          db.add(api.Appointment(
+            tenant_id=tenant_id, customer_id=customers[ci].id, service_id=None if si is None else services[si].id,
+            start_time=start + timedelta(hours=n),
+          ))
+      db.add(api.Appointment(
+        tenant_id=tenant_id, customer_id=customers[1].id, service_id=services[0].id,
+        start_time=start + timedelta(hours=99), status="cancelled",
+      ))
+      db.add(api.CustomerState(tenant_id=tenant_id, customer_id=customers[1].id, state={"preferences": {"lang": "yo"}}))
+      # A customer with more than one state row is still one profile.
+      db.add(api.CustomerState(tenant_id=tenant_id, customer_id=customers[0].id, state={"mode": "idle"}))
+      db.add(api.CustomerState(tenant_id=tenant_id, customer_id=customers[0].id, state={"mode": "awaiting_time"}))
+      db.commit()
+      ids = [c.id for c in customers]
+    finally:
+      db.close()
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+      if "appointments" in statement:
+        statements.append(statement)
+
+    api.event.listen(api.engine, "before_cursor_execute", count)
+    try:
+      first = self.client.get(f"/tenants/{tenant_id}/personalization?limit=2").get_json()
+    finally:
+      api.event.remove(api.engine, "before_cursor_execute", count)
+    self.assertEqual(len(statements), 1)
+
+    profiles = {p["customer_id"]: p for p in first["customer_profiles"]}
+    self.assertEqual(list(profiles), ids[:2])
+    self.assertEqual(profiles[ids[0]]["total_appointments"], 7)
+    self.assertEqual(profiles[ids[0]]["customer_tier"], "VIP")
+    self.assertEqual(profiles[ids[0]]["preferred_services"], ["Cut", "Dye", "Braids"])
+    self.assertEqual(profiles[ids[0]]["state"], {"mode": "idle"})
+    # Bookings without a service still count towards the total, not the preferences.
+    self.assertEqual((profiles[ids[1]]["total_appointments"], profiles[ids[1]]["customer_tier"]), (5, "VIP"))
+    self.assertEqual(profiles[ids[1]]["preferred_services"], ["Dye"])
+    self.assertEqual(profiles[ids[1]]["state"], {"preferences": {"lang": "yo"}})
+
+    rest = self.client.get(f"/tenants/{tenant_id}/personalization?limit=2&cursor={first['next_cursor']}").get_json()
+    self.assertEqual([p["customer_id"] for p in rest["customer_profiles"]], [ids[2]])
+    self.assertEqual(rest["customer_profiles"][0]["customer_tier"], "New")
+    self.assertIsNone(rest["next_cursor"])
+
+    bad = self.client.get(f"/tenants/{tenant_id}/personalization?cursor=nope")
+    self.assertEqual(bad.status_code, 400)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,60 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+
+class RetrievalBenchTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.bench = importlib.import_module("bench_retrieval")
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def test_labelled_dataset_covers_every_profile(self):
+    profiles = self.bench.load_profiles()
+    self.assertTrue(profiles)
+    _, queries = self.bench.build_labelled_documents(profiles)
+    businesses = {q["business"] for q in queries}
+    self.assertEqual(businesses, {str(p["name"]).strip() for p in profiles})
+
+  def test_benchmark_reports_metrics_per_size(self):
+    rows = self.bench.run_benchmark(self.api, [10, 200], k=4, repeat=1)
+    self.assertEqual([r["chunks"] for r in rows], [10, 200])
+    for row in rows:
+      self.assertGreater(row["queries"], 0)
+      for key in ("recall_at_1", "recall_at_k", "mrr"):
+        self.assertGreaterEqual(row[key], 0.0)
+        self.assertLessEqual(row[key], 1.0)
+      self.assertLessEqual(row["p50_ms"], row["p95_ms"])
+
+    # The scratch tenant is cleaned up afterwards.
+    db = self.api.SessionLocal()
+    try:
+      self.assertEqual(db.query(self.api.KnowledgeChunk).count(), 0)
+    finally:
+      db.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
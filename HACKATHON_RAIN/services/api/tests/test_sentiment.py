@@ -0,0 +1,148 @@
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+
+class SentimentTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def test_scoring_handles_negation_and_word_forms(self):
+    score = self.api.score_sentiment
+    self.assertGreater(score("Great service, thanks!"), 0)
+    self.assertLess(score("The delivery was not good"), 0)
+    self.assertGreater(score("Honestly not bad at all"), 0)
+    self.assertLess(score("I didn't love the haircut"), 0)
+    self.assertLess(score("I have complaints about the rude staff"), 0)
+    # Negation doesn't leak across clauses.
+    self.assertGreater(score("Not cheap. But amazing food"), 0)
+    self.assertEqual(score("What time do you open?"), 0)
+    self.assertLess(score("I dont love the wait"), 0)
+
+  def test_words_ending_in_nt_are_not_negators(self):
+    score = self.api.score_sentiment
+    self.assertGreater(score("My appointment was great"), 0)
+    self.assertGreater(score("The payment was quick and easy, great"), 0)
+    self.assertGreater(score("Lovely restaurant"), 0)
+    self.assertGreater(score("The service was excellent"), 0)
+    self.assertGreater(score("I want a great haircut"), 0)
+
+  def test_sentiment_is_aggregated_in_sql_by_day_and_customer(self):
+    api = self.api
+    tenant_id = self._create_tenant("Sentiment Shop")
+    db = api.SessionLocal()
+    try:
+      customers = [api.Customer(tenant_id=tenant_id, phone=f"+23481000000{i}") for i in range(2)]
+      db.add_all(customers)
+      db.flush()
+      customer_ids = [c.id for c in customers]
+      texts = [
+        (customers[0].id, "This is amazing, thank you", 0),
+        (customers[0].id, "Perfect!", 1),
+        (customers[1].id, "Worst order ever, I am angry", 0),
+        (customers[1].id, "Where is my order?", 0),
+        (customers[1].id, "terrible from last month", 40),
+      ]
+      for customer_id, body, age_days in texts:
+        msg = api.Message(
+          tenant_id=tenant_id, customer_id=customer_id, direction="in", text=body,
+          created_at=datetime.utcnow() - timedelta(days=age_days),
+        )
+        db.add(msg)
+      db.commit()
+    finally:
+      db.close()
+
+    body = self.client.get(f"/tenants/{tenant_id}/sentiment-analysis?group_by=customer").get_json()
+    self.assertEqual(body["total_messages"], 4)
+    self.assertEqual(body["sentiment_breakdown"], {"positive": 50.0, "neutral": 25.0, "negative": 25.0})
+    groups = {g["customer"]: g for g in body["groups"]}
+    self.assertEqual(groups[customer_ids[0]]["positive"], 2)
+    self.assertEqual((groups[customer_ids[1]]["negative"], groups[customer_ids[1]]["neutral"]), (1, 1))
+
+    by_day = self.client.get(f"/tenants/{tenant_id}/sentiment-analysis?days=60&group_by=day").get_json()
+    self.assertEqual(by_day["total_messages"], 5)
+    self.assertEqual(sum(g["total"] for g in by_day["groups"]), 5)
+    self.assertGreaterEqual(len(by_day["groups"]), 2)
+
+    bad = self.client.get(f"/tenants/{tenant_id}/sentiment-analysis?group_by=week")
+    self.assertEqual(bad.status_code, 400)
+
+  def test_legacy_messages_are_scored_in_the_background(self):
+    api = self.api
+    tenant_id = self._create_tenant("Legacy Sentiment Shop")
+    db = api.SessionLocal()
+    try:
+      messages = [api.Message(tenant_id=tenant_id, direction="in", text=t) for t in ("Perfect, thanks", "Terrible service")]
+      db.add_all(messages)
+      db.commit()
+      ids = [m.id for m in messages]
+      self.assertEqual([m.sentiment_score for m in messages], [2, -1])
+      # Rows written before scoring at ingest existed.
+      db.execute(api.Message.__table__.update().where(api.Message.id.in_(ids)).values(sentiment_score=None))
+      db.commit()
+      version_before = db.get(api.Tenant, tenant_id).sync_version
+    finally:
+      db.close()
+
+    writes = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+      if statement.startswith("UPDATE messages"):
+        writes.append(threading.current_thread().name)
+
+    api.event.listen(api.engine, "before_cursor_execute", count)
+    try:
+      first = self.client.get(f"/tenants/{tenant_id}/sentiment-analysis").get_json()
+      api.schedule_sentiment_backfill(tenant_id).result(timeout=10)
+    finally:
+      api.event.remove(api.engine, "before_cursor_execute", count)
+    self.assertTrue(writes)
+    self.assertTrue(all(name.startswith("sentiment-backfill") for name in writes), writes)
+    self.assertIn(first.get("total_messages", 0), (0, 2))
+
+    body = self.client.get(f"/tenants/{tenant_id}/sentiment-analysis").get_json()
+    self.assertEqual(body["sentiment_breakdown"], {"positive": 50.0, "neutral": 0.0, "negative": 50.0})
+    # The scores went out with a new row_version, so delta-sync clients see them.
+    db = api.SessionLocal()
+    try:
+      self.assertGreater(db.get(api.Tenant, tenant_id).sync_version, version_before)
+      row_versions = {m.row_version for m in db.query(api.Message).filter(api.Message.id.in_(ids))}
+    finally:
+      db.close()
+    self.assertEqual(row_versions, {version_before + 1})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,185 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+
+class TenantPurgeTests(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls._tmpdir = tempfile.TemporaryDirectory()
+    db_path = os.path.join(cls._tmpdir.name, "test_agentdock.db")
+    db_url = "sqlite:///" + db_path.replace("\\", "/")
+
+    os.environ["DATABASE_URL"] = db_url
+    os.environ["AUTH_REQUIRED"] = "0"
+    os.environ["EVENT_BUS_BACKEND"] = "memory"
+
+    api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if api_dir not in sys.path:
+      sys.path.insert(0, api_dir)
+
+    if "app" in sys.modules:
+      del sys.modules["app"]
+    cls.api = importlib.import_module("app")
+    cls.client = cls.api.app.test_client()
+    cls._batch_size = cls.api.PURGE_BATCH_SIZE
+    cls.api.PURGE_BATCH_SIZE = 10
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.api.PURGE_BATCH_SIZE = cls._batch_size
+    try:
+      cls._tmpdir.cleanup()
+    except Exception:
+      pass
+
+  def _create_tenant(self, name: str) -> int:
+    resp = self.client.post("/tenants", json={"name": name, "business_type": "general"})
+    self.assertEqual(resp.status_code, 201, resp.get_data(as_text=True))
+    return int(resp.get_json()["id"])
+
+  def _seed(self, tenant_id: int, messages: int = 25) -> None:
+    api = self.api
+    db = api.SessionLocal()
+    try:
+      customer = api.Customer(tenant_id=tenant_id, phone=f"+234800{tenant_id:05d}")
+      db.add(customer)
+      db.flush()
+      db.add_all(
+        [api.Message(tenant_id=tenant_id, customer_id=customer.id, direction="in", text=f"m{i}") for i in range(messages)]
+      )
+      db.add_all([api.Order(tenant_id=tenant_id, customer_id=customer.id, status="pending") for _ in range(3)])
+      db.add(api.AgentTrace(tenant_id=tenant_id, customer_id=customer.id))
+      db.commit()
+    finally:
+      db.close()
+
+  def _count(self, model, tenant_id: int) -> int:
+    db = self.api.SessionLocal()
+    try:
+      return db.query(model).filter(model.tenant_id == tenant_id).count()
+    finally:
+      db.close()
+
+  def _wait(self, tenant_id: int, job_id: int) -> dict:
+    deadline = time.monotonic() + 10
+    while True:
+      job = self.client.get(f"/tenants/{tenant_id}/purge-jobs/{job_id}").get_json()
+      if job["status"] in {"done", "failed"} or time.monotonic() > deadline:
+        return job
+      time.sleep(0.02)
+
+  def test_reset_runs_in_batches_and_reports_progress(self):
+    api = self.api
+    tenant_id = self._create_tenant("Reset Shop")
+    self._seed(tenant_id)
+
+    resp = self.client.post(f"/tenants/{tenant_id}/reset", json={})
+    self.assertEqual(resp.status_code, 202, resp.get_data(as_text=True))
+    job = self._wait(tenant_id, resp.get_json()["job_id"])
+    self.assertEqual(job["status"], "done", job)
+    self.assertEqual(job["progress"]["messages"], 25)
+    self.assertEqual(job["progress"]["orders"], 3)
+    self.assertEqual(job["tables_done"], job["tables_total"])
+
+    self.assertEqual(self._count(api.Message, tenant_id), 0)
+    # Reset keeps traces and the tenant itself.
+    self.assertEqual(self._count(api.AgentTrace, tenant_id), 1)
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/messages").status_code, 200)
+
+    types = [e["type"] for e in api.EVENT_BUS.events_after(tenant_id, 0)]
+    self.assertIn("tenant_purge_progress", types)
+    self.assertEqual(types[-1], "tenant_reset")
+
+  def test_tenant_is_fenced_off_while_purging(self):
+    api = self.api
+    tenant_id = self._create_tenant("Fenced Shop")
+    self._seed(tenant_id)
+    db = api.SessionLocal()
+    try:
+      job = api.start_tenant_purge(db, db.get(api.Tenant, tenant_id), "delete")
+      db.commit()
+      job_id = job.id
+    finally:
+      db.close()
+
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/messages").status_code, 410)
+    listed = [t["id"] for t in self.client.get("/tenants?limit=500").get_json()]
+    self.assertNotIn(tenant_id, listed)
+    self.assertEqual(self.client.post(f"/tenants/{tenant_id}/reset", json={}).status_code, 409)
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/purge-jobs/{job_id}").get_json()["status"], "queued")
+
+    api.run_tenant_purge(job_id)
+    job = self.client.get(f"/tenants/{tenant_id}/purge-jobs/{job_id}").get_json()
+    self.assertEqual(job["status"], "done")
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/messages").status_code, 404)
+    self.assertEqual(self._count(api.AgentTrace, tenant_id), 0)
+    self.assertEqual(self._count(api.Owner, tenant_id), 0)
+
+  def test_failed_job_resumes_from_last_batch(self):
+    api = self.api
+    tenant_id = self._create_tenant("Crashy Shop")
+    self._seed(tenant_id)
+    db = api.SessionLocal()
+    try:
+      db.get(api.Tenant, tenant_id).business_profile = {"name": "Crashy Shop"}
+      db.commit()
+      job_id = api.start_tenant_purge(db, db.get(api.Tenant, tenant_id), "reset").id
+      db.commit()
+    finally:
+      db.close()
+
+    original = api._purge_batch
+    calls = {"n": 0}
+
+    def flaky(db, model, condition):
+      calls["n"] += 1
+      if calls["n"] == 3:
+        raise RuntimeError("connection lost")
+      return original(db, model, condition)
+
+    api._purge_batch = flaky
+    try:
+      api.run_tenant_purge(job_id)
+    finally:
+      api._purge_batch = original
+    job = self.client.get(f"/tenants/{tenant_id}/purge-jobs/{job_id}").get_json()
+    self.assertEqual((job["status"], job["progress"]), ("failed", {"messages": 20}))
+    self.assertEqual(self._count(api.Message, tenant_id), 5)
+    self.assertEqual(self.client.get(f"/tenants/{tenant_id}/orders").status_code, 409)
+
+    # The retry asks for the profile to go too; the resumed job honours it.
+    resp = self.client.post(f"/tenants/{tenant_id}/reset", json={"wipe_profile": True})
+    self.assertEqual(resp.get_json()["job_id"], job_id)
+    job = self._wait(tenant_id, job_id)
+    self.assertEqual(job["status"], "done", job)
+    self.assertEqual(job["progress"]["messages"], 25)
+    self.assertEqual(self._count(api.Message, tenant_id), 0)
+    db = api.SessionLocal()
+    try:
+      self.assertIsNone(db.get(api.Tenant, tenant_id).business_profile)
+    finally:
+      db.close()
+
+  def test_live_lease_blocks_a_second_worker(self):
+    api = self.api
+    tenant_id = self._create_tenant("Leased Shop")
+    db = api.SessionLocal()
+    try:
+      job_id = api.start_tenant_purge(db, db.get(api.Tenant, tenant_id), "reset").id
+      db.commit()
+      self.assertTrue(api._claim_purge_job(db, job_id))
+      self.assertFalse(api._claim_purge_job(db, job_id))
+      job = db.get(api.TenantPurgeJob, job_id)
+      job.lease_until = api.datetime.utcnow() - api.timedelta(seconds=1)
+      db.commit()
+      self.assertTrue(api._claim_purge_job(db, job_id))
+    finally:
+      db.close()
+
+
+if __name__ == "__main__":
+  unittest.main()